@@ -55,18 +55,8 @@ class Delicious(Feed):
 
         return retry, retry_url, retry_headers
 
-    def load(self, loadfile=None, dumpfile=None):
-
-        if loadfile is None:
-            raise Exception(
-                'import of delicious data requires HTML dump file.'
-            )
-
-        fh = codecs.open(loadfile, "r", "utf-8")
-
-        try:
-            events = []
-
+    def read_loadfile(self, loadfile):
+        with codecs.open(loadfile, "r", "utf-8") as fh:
             for line in fh:
                 if 'HREF' in line:
 
@@ -88,8 +78,22 @@ class Delicious(Feed):
                         "dt": str(dt)
                     }
 
-                    events.append(self.to_event(data))
-        finally:
-            fh.close()
+                    yield self.to_event(data)
+
+    def load(self, loadfile=None, dumpfile=None):
+
+        if loadfile is None:
+            raise Exception(
+                'import of delicious data requires HTML dump file.'
+            )
+
+        return list(self.read_loadfile(loadfile))
+
+    def backfill(self, loadfile=None, **kwargs):
+
+        if loadfile is None:
+            raise Exception(
+                'import of delicious data requires HTML dump file.'
+            )
 
-        return events
+        return Feed.backfill(self, loadfile=loadfile, **kwargs)
@@ -325,6 +325,11 @@ class Fitbit(Feed):
 
     def load(self, loadfile=None, dumpfile=None):
         # need to set last sync time before processing any items
-        self.fetch_last_sync_datetime()
+        self.fetch_last_sync_time()
+
+        return Feed.load(self, loadfile, dumpfile)
+
+    def backfill(self, *args, **kwargs):
+        self.fetch_last_sync_time()
 
-        Feed.load(self, loadfile, dumpfile)
+        return Feed.backfill(self, *args, **kwargs)
@@ -65,3 +65,6 @@ class Twitter(Feed):
 
     def load(self, loadfile=None, dumpfile=None):
         raise Exception('Not implemented.')
+
+    def backfill(self, *args, **kwargs):
+        raise Exception('Not implemented.')
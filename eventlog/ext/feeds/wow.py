@@ -94,3 +94,6 @@ class WoW(Feed):
 
     def load(self, loadfile=None, dumpfile=None):
         raise Exception('Not implemented.')
+
+    def backfill(self, *args, **kwargs):
+        raise Exception('Not implemented.')
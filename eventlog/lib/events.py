@@ -3,8 +3,8 @@ import logging
 import uuid
 import enum
 
-from .scraper import (get_thumbnail_from_url, save_img_to_dir,
-                      image_url_to_file)
+from .scraper import (get_largest_image, fit_image, save_img_to_dir,
+                      save_thumbnail_content, image_url_to_file)
 from .archiver import archive_url
 from .util import utc_datetime_to_local, pg_strptime, urlize
 
@@ -177,27 +177,78 @@ class Event:
         exclude_md5s=None,
         dry=False
     ):
+        img = self.fetch_thumbnail(width, height)
+
+        self.save_thumbnail(
+            img,
+            width,
+            height,
+            staticroot,
+            subdir,
+            exclude_md5s=exclude_md5s,
+            dry=dry
+        )
+
+    def fetch_thumbnail(self, width, height):
+        """Returns the largest image (of at least width x height) found at
+        thumbnail_url, or None. This is the network bound half of
+        add_thumbnail.
+
+        """
         if self.thumbnail_url is None:
             _LOG.debug('no image URL provided')
-            return
+            return None
 
         _LOG.debug('using image URL: %s', self.thumbnail_url)
 
-        img = get_thumbnail_from_url(self.thumbnail_url, width, height)
+        img = get_largest_image(self.thumbnail_url, width, height)
+
+        if img is None:
+            _LOG.info(
+                'unable to find suitable thumbnail image from URL: %s',
+                self.thumbnail_url
+            )
 
-        if img is not None:
+        return img
+
+    def save_thumbnail(
+        self,
+        img,
+        width,
+        height,
+        staticroot,
+        subdir,
+        exclude_md5s=None,
+        dry=False,
+        pool=None
+    ):
+        """Crops img (as returned by fetch_thumbnail) to width x height and
+        saves it as this event's thumbnail. This is the CPU bound half of
+        add_thumbnail, done in pool (an image_process_pool) if given.
+
+        """
+        if img is None:
+            return
+
+        if pool is None:
             self.thumbnail = save_img_to_dir(
-                img,
+                fit_image(img, width, height),
                 staticroot,
                 subdir,
                 exclude_md5s=exclude_md5s,
                 dry=dry
             )
         else:
-            _LOG.info(
-                'unable to find suitable thumbnail image from URL: %s',
-                self.thumbnail_url
-            )
+            self.thumbnail = pool.submit(
+                save_thumbnail_content,
+                img.content,
+                width,
+                height,
+                staticroot,
+                subdir,
+                exclude_md5s=exclude_md5s,
+                dry=dry
+            ).result()
 
     def add_original(self, staticroot, subdir, dry=False):
 
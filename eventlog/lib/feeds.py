@@ -1,15 +1,25 @@
+import os
 import abc
 import logging
+import datetime
 import pytz
 import json
 import time
 import httplib2
 
+from concurrent.futures import ThreadPoolExecutor
+
 from .util import urlize
 from .events import Fields
+from .scraper import image_process_pool
 
 _LOG = logging.getLogger(__name__)
 
+# default limits for each stage of embelish_events
+_FETCH_WORKERS = 8
+_IMAGE_WORKERS = 2
+_ARCHIVE_WORKERS = 2
+
 
 class HTTPRequestFailure(Exception):
     pass
@@ -117,6 +127,11 @@ class Feed(metaclass=abc.ABCMeta):
         return False, None, None
 
     def iter_events(self, **kwargs):
+        for events in self.iter_pages(**kwargs):
+            yield from events
+
+    def iter_pages(self, **kwargs):
+        """Generator yielding the events of each page of responses."""
 
         load_all = kwargs.get('all', False)
         use_rate_limit = kwargs.get('rate_limit', False)
@@ -163,7 +178,7 @@ class Feed(metaclass=abc.ABCMeta):
 
             events, url, headers = self.parse(data)
 
-            yield from events
+            yield events
 
             # if this feed is not keyed on the occurred time
             # and we have not explicitly requested all data, return early
@@ -175,48 +190,74 @@ class Feed(metaclass=abc.ABCMeta):
                 time.sleep(1.0 / self.rate_limit)
 
     def fetch(self, **kwargs):
+        return list(self.iter_new(**kwargs))
+
+    def iter_new(self, **kwargs):
+        """Generator yielding the events from iter_pages which are not
+        already in the store.
 
+        """
         last_updated = kwargs.get('last_updated')
         last_key = kwargs.get('last_key')
 
-        events = []
-
-        for e in self.iter_events(**kwargs):
+        for events in self.iter_pages(**kwargs):
 
             if self.key_field is not Fields.OCCURRED:
 
-                # attempt to grab event, if it doesn't exist, add it
-                key_val = self.key_field.get_from(e)
+                keys = [self.key_field.get_from(e) for e in events]
+
+                found_last = last_key is not None and last_key in keys
+
+                if found_last:
+                    events = events[:keys.index(last_key)]
+                    keys = keys[:len(events)]
+
+                # a single query for all keys of the page
+                existing = self.store.exists_many(self.key_field, keys)
+
+                for e, key_val in zip(events, keys):
+                    if key_val not in existing:
+                        yield e
+                    else:
+                        _LOG.debug("%s... already exists. Ignoring.", str(e))
 
-                if last_key is not None and (key_val == last_key):
+                if found_last:
                     _LOG.debug(
                         "%s matches last known value :'%s'. Stopping.",
                         str(self.key_field),
-                        key_val
+                        last_key
                     )
-                    break
-
-                exists = self.store.exists(self.key_field, key_val)
-
-                if not exists:
-                    events.append(e)
-                else:  # pragma: no cover
-                    _LOG.debug("%s... already exists. Ignoring.", str(e))
+                    return
 
             else:   # add any events newer then the last entry for that source
 
-                if (last_updated is None) or (e.occurred > last_updated):
-                    events.append(e)
-                else:
-                    _LOG.debug("%s... is old.", str(e))
-                    break
-
-        return events
+                for e in events:
+                    if (last_updated is None) or (e.occurred > last_updated):
+                        yield e
+                    else:
+                        _LOG.debug("%s... is old.", str(e))
+                        return
 
     def group(self, events, latest_event=None):
+        """Returns a new list of events, where each event occurring within
+        grouped_window of the latest in its group is added to the first event
+        of that group (as related) rather than listed itself.
+
+        Grouping continues the group of latest_event, if given, which is then
+        included in the list should any events be added to it.
 
+        """
         if not self.grouped:
-            return
+            return list(events)
+
+        # only an event from outside the list would need adding to it
+        outside = latest_event
+
+        if any(e is outside for e in events):
+            outside = None
+
+        grouped = set()
+        extended = False
 
         for e in sorted(events, key=lambda x: x.occurred):
 
@@ -235,12 +276,10 @@ class Feed(metaclass=abc.ABCMeta):
                 # add new related
                 latest_event.add_related(e)
 
-                # add parent event if it doesn't exist
-                if latest_event not in events:
-                    events.append(latest_event)
+                extended = extended or latest_event is outside
 
                 # remove this as an event to be added
-                events.remove(e)
+                grouped.add(id(e))
 
                 _LOG.info("grouped %s", str(e))
 
@@ -248,6 +287,14 @@ class Feed(metaclass=abc.ABCMeta):
             else:
                 latest_event = e
 
+        result = [e for e in events if id(e) not in grouped]
+
+        # add parent event if it wasn't already listed
+        if extended:
+            result.append(outside)
+
+        return result
+
     def update(self, dry=False):
         start = time.time()
 
@@ -270,11 +317,10 @@ class Feed(metaclass=abc.ABCMeta):
             added = len(events)
 
             # embelish
-            for e in events:
-                self.embelish(e, dry=dry)
+            self.embelish_events(events, dry=dry)
 
             # do any grouping
-            self.group(events, latest_event)
+            events = self.group(events, latest_event)
 
             # persist events
             self.store.add_events(events, dry=dry)
@@ -313,50 +359,145 @@ class Feed(metaclass=abc.ABCMeta):
             dry=dry
         )
 
-    def load(self, loadfile=None, dumpfile=None):
+    def embelish_events(self, events, dry=False):
+        """Embelishes events as embelish does, overlapping the work for all of
+        them in stages of bounded concurrency: downloads (of thumbnail
+        candidates and originals) use up to fetch_workers at a time, cropping
+        and saving thumbnails up to image_workers (in a process pool of
+        image_processes, shared by all feeds, if set), and archiving up to
+        archive_workers wget processes.
 
-        events = []
+        The first exception raised by any stage is re-raised, once work
+        already under way has finished and the rest has been cancelled.
 
-        if loadfile is not None:
-            with open(loadfile) as fh:
-                for line in fh:
-                    data = json.loads(line)
-                    loaded, _, _ = self.parse(data)
-                    events += loaded
+        """
+        width = self.config['thumbnail_width']
+        height = self.config['thumbnail_height']
+        media_dir = self.config['media_dir']
 
-            events = sorted(events, key=lambda x: x.occurred)
+        processes = self.config.get('image_processes')
 
-            _LOG.info("%d events loaded from dump", len(events))
+        # decode, crop and save thumbnails in other processes, if configured
+        pool = image_process_pool(processes) if processes else None
 
-        latest_date = None
-        latest_key = None
+        fetching = ThreadPoolExecutor(
+            self.config.get('fetch_workers', _FETCH_WORKERS)
+        )
+        imaging = ThreadPoolExecutor(
+            self.config.get('image_workers', _IMAGE_WORKERS)
+        )
+        archiving = ThreadPoolExecutor(
+            self.config.get('archive_workers', _ARCHIVE_WORKERS)
+        )
 
-        if events:
+        def thumbnail(event):
+            img = event.fetch_thumbnail(width, height)
+
+            if img is None:
+                return None
+
+            # hand over to the image stage, freeing this fetch worker
+            return imaging.submit(
+                event.save_thumbnail,
+                img,
+                width,
+                height,
+                media_dir,
+                self.config['thumbnail_subdir'],
+                exclude_md5s=self.config.get('thumbnail_md5_exclude_list'),
+                dry=dry,
+                pool=pool
+            )
 
-            if self.key_field is Fields.OCCURRED:
-                latest_date = events[-1].latest_occurred
-                _LOG.info('last known event from: %s', str(latest_date))
-            else:
-                latest_key = self.key_field.get_from(events[-1])
-                _LOG.info(
-                    'last known event with %s: %s',
-                    str(self.key_field),
-                    str(latest_key)
-                )
+        thumbnails = []
+        pending = []
+        cancel = False
 
+        try:
+            for e in events:
+                thumbnails.append(fetching.submit(thumbnail, e))
+
+                pending.append(fetching.submit(
+                    e.add_original,
+                    media_dir,
+                    self.config['original_subdir'],
+                    dry=dry
+                ))
+
+                pending.append(archiving.submit(
+                    e.add_archive,
+                    media_dir,
+                    self.config['archive_subdir'],
+                    dry=dry
+                ))
+
+            for f in thumbnails:
+                saving = f.result()
+
+                if saving is not None:
+                    pending.append(saving)
+
+            for f in pending:
+                f.result()
+
+        except BaseException:
+            cancel = True
+            raise
+
+        finally:
+            # fetching first, as it feeds the image stage
+            for executor in (fetching, imaging, archiving):
+                executor.shutdown(cancel_futures=cancel)
+
+    def read_loadfile(self, loadfile):
+        """Generator yielding the events parsed from loadfile, one line (of
+        response data) at a time. Feeds with load files in another format
+        override this, for both load and backfill.
+
+        """
+        with open(loadfile) as fh:
+            for line in fh:
+                data = json.loads(line)
+                loaded, _, _ = self.parse(data)
+                yield from loaded
+
+    def _remote_kwargs(self, latest_event):
+        # fetch anything newer than the latest event loaded from file
         kwargs = {
             'rate_limit': True
         }
 
-        if latest_date is not None:
-            kwargs['last_updated'] = latest_date
+        if latest_event is None:
+            kwargs['all'] = True
+        elif self.key_field is Fields.OCCURRED:
+            kwargs['last_updated'] = latest_event.latest_occurred
+            _LOG.info('last known event from: %s', str(kwargs['last_updated']))
         else:
             kwargs['all'] = True
+            kwargs['last_key'] = self.key_field.get_from(latest_event)
+            _LOG.info(
+                'last known event with %s: %s',
+                str(self.key_field),
+                str(kwargs['last_key'])
+            )
+
+        return kwargs
+
+    def load(self, loadfile=None, dumpfile=None):
+
+        events = []
+
+        if loadfile is not None:
+            events = sorted(
+                self.read_loadfile(loadfile),
+                key=lambda x: x.occurred
+            )
 
-        if latest_key is not None:
-            kwargs['last_key'] = latest_key
+            _LOG.info("%d events loaded from dump", len(events))
 
-        from_remote = self.fetch(**kwargs)
+        from_remote = self.fetch(
+            **self._remote_kwargs(events[-1] if events else None)
+        )
 
         _LOG.info("%d events loaded from remote", len(from_remote))
 
@@ -368,3 +509,114 @@ class Feed(metaclass=abc.ABCMeta):
                     fh.write('%s\n' % json.dumps(e.raw))
 
         return events
+
+    def _read_checkpoint(self, checkpoint):
+        progress = {'loaded': 0, 'fetched': 0, 'newest': None}
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint) as fh:
+                progress.update(json.load(fh))
+
+            if progress['newest'] is not None:
+                progress['newest'] = datetime.datetime.fromisoformat(
+                    progress['newest']
+                )
+
+            _LOG.info("resuming backfill from checkpoint: %s", progress)
+
+        return progress
+
+    def _write_checkpoint(self, checkpoint, progress):
+        data = dict(progress)
+
+        if data['newest'] is not None:
+            data['newest'] = data['newest'].isoformat()
+
+        # replaced in one step, so an interruption never leaves it partial
+        with open(checkpoint + '.tmp', 'w') as fh:
+            json.dump(data, fh)
+
+        os.replace(checkpoint + '.tmp', checkpoint)
+
+    def backfill(self, loadfile=None, chunksize=1000, checkpoint=None,
+                 dry=False):
+        """Adds all events for this feed to the store, as load would find
+        them, while only holding chunksize events in memory at a time.
+
+        Each chunk is written by Store.copy_events in a transaction of its
+        own, after which progress is saved to the checkpoint file (if given).
+        An interrupted backfill run again with the same checkpoint continues
+        after the last chunk written.
+
+        """
+        progress = self._read_checkpoint(checkpoint)
+
+        added = 0
+        chunk = []
+
+        def flush():
+            nonlocal added, chunk
+
+            if not chunk:
+                return
+
+            self.store.copy_events(chunk, dry=dry)
+
+            added += len(chunk)
+            chunk = []
+
+            if checkpoint is not None and not dry:
+                self._write_checkpoint(checkpoint, progress)
+
+            _LOG.info("%d events backfilled", added)
+
+        # events from the load file, lazily, skipping those already written
+        latest_event = None
+        loaded = 0
+
+        if loadfile is not None:
+            for e in self.read_loadfile(loadfile):
+                if (latest_event is None or
+                        e.occurred > latest_event.occurred):
+                    latest_event = e
+
+                loaded += 1
+
+                if loaded <= progress['loaded']:
+                    continue
+
+                chunk.append(e)
+                progress['loaded'] = loaded
+
+                if len(chunk) >= chunksize:
+                    flush()
+
+            flush()
+
+        # events from remote, newest first for feeds keyed on occurred, where
+        # those written previously follow any newer than when the backfill
+        # started (other feeds skip events written by key in iter_new)
+        fetched = 0
+
+        for e in self.iter_new(**self._remote_kwargs(latest_event)):
+            if self.key_field is Fields.OCCURRED:
+                if progress['newest'] is None:
+                    progress['newest'] = e.occurred
+                elif e.occurred > progress['newest']:
+                    continue
+
+                fetched += 1
+
+                if fetched <= progress['fetched']:
+                    continue
+
+                progress['fetched'] = fetched
+
+            chunk.append(e)
+
+            if len(chunk) >= chunksize:
+                flush()
+
+        flush()
+
+        return added
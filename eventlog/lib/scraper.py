@@ -8,6 +8,9 @@ import hashlib
 import urllib.request
 import urllib.parse
 import urllib.error
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from importlib.metadata import version
 import httplib2
 
@@ -36,6 +39,9 @@ _LOG = logging.getLogger(__name__)
 # prevent memory issues with very large images
 Image.warnings.simplefilter('error', Image.DecompressionBombWarning)
 
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
 
 def fetch_url(url):
 
@@ -151,6 +157,10 @@ def content_to_image_obj(content, url):
 
         # reset file
         im = Image.open(BytesIO(content))
+
+        # keep the content as fetched, to hand over (undecoded) to
+        # save_thumbnail_content
+        im.content = content
     except Exception:
         _LOG.exception("unable to verify image from url: %s", repr(url))
         im = None
@@ -246,11 +256,17 @@ def get_thumbnail_from_url(url, width, height):
     image = get_largest_image(url, width, height)
 
     if image is not None:
+        image = fit_image(image, width, height)
+
+    return image
+
 
-        image_width, image_height = image.size
+def fit_image(image, width, height):
 
-        if image_width > width or image_height > height:
-            image = crop_image(image, width, height)
+    image_width, image_height = image.size
+
+    if image_width > width or image_height > height:
+        image = crop_image(image, width, height)
 
     return image
 
@@ -385,3 +401,41 @@ def save_img_to_dir(img, rootdir, subdir, exclude_md5s=None, dry=False,
         }
 
     return metadata
+
+
+def save_thumbnail_content(content, width, height, rootdir, subdir,
+                           exclude_md5s=None, dry=False):
+    """Decodes image content, crops it to width x height and saves it as
+    save_img_to_dir does, returning the same metadata. Only plain data is
+    passed in and out, so it can be run in an image_process_pool.
+
+    """
+    img = Image.open(BytesIO(content))
+
+    return save_img_to_dir(
+        fit_image(img, width, height),
+        rootdir,
+        subdir,
+        exclude_md5s=exclude_md5s,
+        dry=dry
+    )
+
+
+def image_process_pool(processes):
+    """Returns the process pool shared by all thumbnail processing in this
+    process, creating it (with the given number of processes) on first use.
+
+    Workers are started from a fork server rather than forked from the
+    caller, so they don't inherit its event loop or database connections.
+
+    """
+    global _PROCESS_POOL
+
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(
+                processes,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+
+    return _PROCESS_POOL
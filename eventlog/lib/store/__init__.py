@@ -1,7 +1,13 @@
+import io
+import json
+import collections
 import logging
 import datetime
 import uuid
 
+import psycopg2.extras
+import psycopg2.extensions
+
 from eventlog.lib.events import Fields, InvalidField, MissingEventIDException
 from eventlog.lib.feeds import Feed, MissingFeedIDException
 from eventlog.lib.loader import load
@@ -9,12 +15,78 @@ from eventlog.lib.util import local_datetime_to_utc
 
 from .eventquery import EventQuery
 from .eventset import EventSetByQuery
-from .search import Index
+from .search import Index, ShardedIndex
 from .query import Query
 from .pool import Pool
 
 _LOG = logging.getLogger(__name__)
 
+# channel notified with the IDs of newly added events
+EVENTS_CHANNEL = 'eventlog_events'
+
+# notification payloads are limited to 8000 bytes, so IDs are sent in batches
+_NOTIFY_BATCH_SIZE = 200
+
+
+# columns which update_events can change, with their types
+_UPDATABLE = collections.OrderedDict([
+    ('title', 'text'),
+    ('text', 'text'),
+    ('link', 'text'),
+    ('occurred', 'timestamptz'),
+    ('raw', 'json'),
+    ('thumbnail', 'jsonb'),
+    ('original', 'jsonb'),
+    ('archived', 'jsonb')
+])
+
+# columns which are part of indexed documents
+_INDEXED = {'title', 'text', 'occurred'}
+
+
+def _feed_id(event):
+    return event.feed['id'] if event.feed is not None else None
+
+
+def _copy_value(value):
+    # a value in COPY's text format (what the default adapters would send)
+    if value is None:
+        return '\\N'
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+
+    return (
+        value.replace('\\', '\\\\')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+        .replace('\t', '\\t')
+    )
+
+
+def _copy_rows(cur, table, rows):
+    # COPY can't be used with a wait callback (i.e. when psycopg2 is patched
+    # for gevent), in which case rows are sent as multi-row inserts instead
+    if psycopg2.extensions.get_wait_callback() is not None:
+        psycopg2.extras.execute_values(
+            cur, "insert into " + table + " values %s", rows, page_size=500
+        )
+        return
+
+    fh = io.StringIO()
+
+    for values in rows:
+        fh.write('\t'.join(_copy_value(v) for v in values) + '\n')
+
+    fh.seek(0)
+
+    cur.copy_expert("copy " + table + " from stdin", fh)
+
 
 class Store:
 
@@ -31,7 +103,13 @@ class Store:
             'DB_NAME': 'eventlog',
             'DB_POOL_MIN_CONN': 10,
             'DB_POOL_MAX_CONN': 20,
+            'DB_POOL_TIMEOUT': 30,
             'INDEX_DIR': None,
+            'INDEX_CACHE_SIZE': 256,
+            'INDEX_WRITE_TIMEOUT': 60,
+            'INDEX_MAX_SEGMENTS': 10,
+            'INDEX_MERGE_FACTOR': 10,
+            'INDEX_SHARDED': False,
             'MEDIA_DIR': None,
             'THUMBNAIL_SUBDIR': 'thumbs',
             'THUMBNAIL_WIDTH': 200,
@@ -50,7 +128,8 @@ class Store:
             self._config['DB_POOL_MAX_CONN'],
             self._config['DB_NAME'],
             self._config['DB_USER'],
-            self._config['DB_PASS']
+            self._config['DB_PASS'],
+            timeout=self._config['DB_POOL_TIMEOUT']
         )
 
         self._index = self._init_index()
@@ -62,7 +141,18 @@ class Store:
             )
             return None
         else:
-            index = Index(self._config['INDEX_DIR'])
+            if self._config['INDEX_SHARDED']:
+                cls = ShardedIndex
+            else:
+                cls = Index
+
+            index = cls(
+                self._config['INDEX_DIR'],
+                cache_size=self._config['INDEX_CACHE_SIZE'],
+                write_timeout=self._config['INDEX_WRITE_TIMEOUT'],
+                max_segments=self._config['INDEX_MAX_SEGMENTS'],
+                merge_factor=self._config['INDEX_MERGE_FACTOR']
+            )
             return index
 
     def exists(self, field, value):
@@ -81,6 +171,98 @@ class Store:
 
         return True if res is not None else False
 
+    def exists_many(self, field, values):
+        """Returns the set of those values which the field of an event in the
+        store already has, with a single query.
+
+        """
+        # verify field is valid
+        if not isinstance(field, Fields):
+            raise InvalidField
+
+        values = list(values)
+
+        if not values:
+            return set()
+
+        query = Query(
+            "select distinct {events}." + str(field) + " from events {events}"
+        )
+        query = query.add_clause(
+            "{events}." + str(field) + " = any(%s)", (values, )
+        )
+
+        with self._pool.connect() as cur:
+            cur.execute(query.format(), query.params)
+
+            return set(r[0] for r in cur)
+
+    def _bump_generations(self, cur, feed_ids):
+        # generations are bumped within the same transaction as the write,
+        # so readers only ever observe a new generation alongside new data
+        # (and again once the index is written, see _bump_indexed)
+        feed_ids = sorted(set(i for i in feed_ids if i is not None))
+
+        if not feed_ids:
+            return
+
+        cur.execute(
+            """
+            insert into generations (feed_id, generation, modified)
+            select feed_id, 1, now() from unnest(%s) as feed_id
+            on conflict (feed_id) do update
+            set generation = generations.generation + 1,
+                modified = excluded.modified
+            """,
+            (feed_ids, )
+        )
+
+    def _bump_indexed(self, feed_ids, dry=False):
+        # searches made between the write's commit and the index's found the
+        # old index under the new generation, so bump it once more now that
+        # the index is written, and whatever they cached is never looked up
+        with self._pool.connect(
+            dry=dry,
+            error_message="rolled back generation changes"
+        ) as cur:
+            self._bump_generations(cur, feed_ids)
+
+    def _notify_added(self, cur, ids):
+        # notifications are only delivered once (and if) the transaction
+        # commits
+        for i in range(0, len(ids), _NOTIFY_BATCH_SIZE):
+            cur.execute(
+                "select pg_notify(%s, %s)",
+                (EVENTS_CHANNEL, ','.join(ids[i:i + _NOTIFY_BATCH_SIZE]))
+            )
+
+    def listen_events(self, timeout=None):
+        """Generator yielding lists of IDs of events as they are added to
+        the store (by any process), or an empty list if none were added
+        within timeout seconds.
+
+        """
+        for payloads in self._pool.listen(EVENTS_CHANNEL, timeout=timeout):
+            yield [i for p in payloads for i in p.split(',')]
+
+    def get_generations(self):
+
+        generations = {}
+
+        with self._pool.connect() as cur:
+            cur.execute(
+                """
+                select f.short_name, coalesce(g.generation, 0), g.modified
+                from feeds f
+                left outer join generations g on g.feed_id = f.id
+                """
+            )
+
+            for short_name, generation, modified in cur:
+                generations[short_name] = (generation, modified)
+
+        return generations
+
     def update_feeds(self, feeds, dry=False):
         with self._pool.connect(
             dry=dry,
@@ -107,6 +289,8 @@ class Store:
                         "Feed with ID '%s' does not exist" % (f.id)
                     )
 
+            self._bump_generations(cur, [f.id for f in feeds])
+
     def add_events(self, events, dry=False):
 
         with self._pool.connect(
@@ -114,6 +298,8 @@ class Store:
             error_message="rolled back new event changes"
         ) as cur:
 
+            added = []
+
             for e in events:
 
                 cur.execute(
@@ -127,6 +313,8 @@ class Store:
 
                 if not cur.rowcount:
                     _LOG.warning('skipping existing event id=%s', e.id)
+                else:
+                    added.append(str(e.id))
 
                 if e.related is not None:
                     for c in e.related:
@@ -160,80 +348,262 @@ class Store:
 
                 _LOG.info("saved %s", str(e))
 
+            feed_ids = [_feed_id(e) for e in events]
+
+            self._bump_generations(cur, feed_ids)
+
+            self._notify_added(cur, added)
+
         # index new events
         self._index.index(events, dry=dry)
 
-    def update_events(self, events, dry=False):
+        self._bump_indexed(feed_ids, dry=dry)
+
+    def copy_events(self, events, dry=False):
+        """Adds events like add_events, but sends them all at once (with COPY
+        where possible) into a temporary table and inserts them from there,
+        which is much faster for a large number of events (i.e. backfills).
+
+        """
+        rows = []
+        related = []
+
+        for e in events:
+            rows.append(e.tuple())
+
+            if e.related is not None:
+                for c in e.related:
+                    if c.feed is None:
+                        c.feed = e.feed
+
+                    rows.append(c.tuple(is_related=True))
+                    related.append((e.id, c.id))
+
         with self._pool.connect(
             dry=dry,
-            error_message="rolled back update event changes"
+            error_message="rolled back copied event changes"
         ) as cur:
 
-            for e in events:
+            cur.execute(
+                """
+                create temporary table copied_events (like events)
+                on commit drop
+                """
+            )
+            cur.execute(
+                """
+                create temporary table copied_related_events
+                (like related_events) on commit drop
+                """
+            )
 
-                cur.execute(
+            _copy_rows(cur, 'copied_events', rows)
+            _copy_rows(cur, 'copied_related_events', related)
+
+            cur.execute(
+                """
+                insert into events
+                select * from copied_events where not is_related
+                on conflict do nothing
+                returning id
+                """
+            )
+
+            added = [str(r[0]) for r in cur]
+
+            # if the event already exists need is_related to be set properly
+            cur.execute(
+                """
+                insert into events
+                select distinct on (id) * from copied_events where is_related
+                on conflict (id) do update
+                set is_related = excluded.is_related
+                """
+            )
+
+            cur.execute(
+                """
+                insert into related_events
+                select * from copied_related_events
+                on conflict do nothing
+                """
+            )
+
+            if len(added) < len(events):
+                _LOG.warning(
+                    'skipped %d existing events', len(events) - len(added)
+                )
+
+            _LOG.info("saved %d events", len(added))
+
+            feed_ids = [_feed_id(e) for e in events]
+
+            self._bump_generations(cur, feed_ids)
+
+            self._notify_added(cur, added)
+
+        # index new events
+        self._index.index(events, dry=dry)
+
+        self._bump_indexed(feed_ids, dry=dry)
+
+    def update_events(self, events, dry=False, fields=None):
+        """Updates the given fields (all updatable fields by default) of
+        events with their current values, with a single statement.
+
+        Events are only re-indexed when an indexed field (title, text or
+        occurred) is updated.
+
+        """
+        if fields is None:
+            fields = list(_UPDATABLE)
+
+        if not fields:
+            raise InvalidField("No fields to update")
+
+        for field in fields:
+            if field not in _UPDATABLE:
+                raise InvalidField("Can't update field '%s'" % (field))
+
+        # the last update of any event given more than once wins
+        by_id = collections.OrderedDict((str(e.id), e) for e in events)
+
+        with self._pool.connect(
+            dry=dry,
+            error_message="rolled back update event changes"
+        ) as cur:
+
+            if by_id:
+                updated = psycopg2.extras.execute_values(
+                    cur,
                     """
                     update events
-                    set (title, text, link, occurred,
-                         raw, thumbnail, original, archived) =
-                        (%s, %s, %s, %s, %s, %s, %s, %s)
-                    where id = %s
+                    set """ + ", ".join(
+                        "%s = v.%s::%s" % (field, field, _UPDATABLE[field])
+                        for field in fields
+                    ) + """
+                    from (values %s) as v (id, """ + ", ".join(fields) + """)
+                    where events.id = v.id::uuid
+                    returning events.id
                     """,
-                    e.tuple()[2:-1] + (e.id, )
+                    [
+                        (i, ) + tuple(getattr(e, field) for field in fields)
+                        for i, e in by_id.items()
+                    ],
+                    page_size=len(by_id),
+                    fetch=True
                 )
 
-                if not cur.rowcount:
+                missing = set(by_id) - set(str(r[0]) for r in updated)
+
+                if missing:
                     raise MissingEventIDException(
-                        "Event with ID '%s' does not exist" % (e.id)
+                        "Event with ID '%s' does not exist" % (min(missing))
                     )
 
+            for e in events:
                 _LOG.info("updated %s", str(e))
 
+            feed_ids = [_feed_id(e) for e in events]
+
+            self._bump_generations(cur, feed_ids)
+
         # re-index events
-        self._index.index(events, dry=dry)
+        if _INDEXED.intersection(fields):
+            self._index.index(events, dry=dry)
+
+            self._bump_indexed(feed_ids, dry=dry)
 
     def remove_events(self, events=None, feed=None, dry=False):
 
         if events is None and feed is None:
             return
 
+        if events is not None:  # delete specified events
+            # along with their related events, unless also related to
+            # another event which remains
+            targets = """
+                with parents as (
+                    select unnest(%s::uuid[]) as id
+                ),
+                targets as (
+                    select id from parents
+                    union
+                    select r.child from related_events r
+                    where r.parent in (select id from parents)
+                    and not exists (
+                        select 1 from related_events o
+                        where o.child = r.child
+                        and o.parent not in (select id from parents)
+                    )
+                )
+            """
+            params = ([str(e.id) for e in events], )
+        else:
+            targets = """
+                with targets as (
+                    select e.id from events e
+                    join feeds f on f.id = e.feed_id
+                    where f.short_name = %s
+                )
+            """
+            params = (feed, )
+
         with self._pool.connect(
             dry=dry,
             error_message="rolled back remove event changes"
         ) as cur:
 
-            if events is not None:  # delete specified events
-                for e in events:
-                    if e.related is not None:
-                        cur.execute(
-                            "delete from related_events where parent=%s",
-                            (e.id,)
-                        )
-
-                        for c in e.related:
-                            cur.execute(
-                                "delete from events where id=%s", (c.id,)
-                            )
+            # foreign keys are checked at the end of the statement, by which
+            # point all references to removed events are gone
+            cur.execute(
+                targets + """
+                , unlinked as (
+                    delete from related_events
+                    where parent in (select id from targets)
+                    or child in (select id from targets)
+                ),
+                removed as (
+                    delete from events
+                    where id in (select id from targets)
+                    returning id, feed_id
+                )
+                select r.id, r.feed_id, f.short_name
+                from removed r left join feeds f on f.id = r.feed_id
+                """,
+                params
+            )
 
-                    cur.execute("delete from events where id=%s", (e.id,))
+            removed = cur.fetchall()
 
-                    _LOG.info("removed %s", str(e))
+            if events is None:
+                _LOG.info("removed all events for feed %s", feed)
 
-            elif feed is not None:
                 cur.execute(
-                    """
-                    delete from events
-                    where feed_id in (
-                        select id from feeds where short_name = %s
-                    )
-                    """,
-                    (feed, )
+                    "select id from feeds where short_name = %s", (feed, )
                 )
 
-                _LOG.info("removed all events for feed %s", feed)
+                feed_ids = [r[0] for r in cur.fetchall()]
+            else:
+                _LOG.info("removed %d events", len(removed))
+
+                feed_ids = [r[1] for r in removed]
+
+            self._bump_generations(cur, feed_ids)
+
+        # remove index values here, feeds are removed as a whole
+        if events is not None:
+            self._index.remove(
+                documents=[
+                    {'id': str(i), 'feed': short_name}
+                    for i, _, short_name in removed
+                ],
+                dry=dry
+            )
+        else:
+            self._index.remove(feed=feed, dry=dry)
 
-        # remove index values here
-        self._index.remove(events=events, feed=feed, dry=dry)
+        self._bump_indexed(feed_ids, dry=dry)
 
     def get_feeds(self, include_admin=False, **kwargs):
         flags = ['is_public', 'is_updating', 'is_searchable']
@@ -5,10 +5,12 @@ import datetime
 from collections import namedtuple
 
 import whoosh.query
+import whoosh.sorting
 from whoosh.qparser import MultifieldParser
 
 from eventlog.lib.events import Event
-from eventlog.lib.util import local_datetime_to_utc, utc_datetime_to_local
+from eventlog.lib.util import (local_datetime_to_utc, utc_datetime_to_local,
+                               is_aware)
 
 from .pagination import Page, InvalidPage, ByTimeRangeCursor, BySearchCursor
 
@@ -94,10 +96,18 @@ class EventSetByQuery(EventSet):
         return num
 
     def __iter__(self):
+        return self.iter()
+
+    def iter(self, server_side=False):
+        """Iterates through all events in the set, fetching them in batches
+        from a server side cursor if server_side (i.e. for large sets), rather
+        than all at once.
+
+        """
         # reset query limit
         self._eventquery.set_limit(None)
 
-        with self._pool.connect() as cur:
+        with self._pool.connect(server_side=server_side) as cur:
 
             # executing as iterable, get all
             cur.execute(self._eventquery.query, self._eventquery.params)
@@ -144,20 +154,45 @@ class EventSetByQuery(EventSet):
 
 SearchMetadata = namedtuple('Metadata', ['count', 'latest'])
 
+SORT_RELEVANCE = 'relevance'
+SORT_NEWEST = 'newest'
+SORT_OLDEST = 'oldest'
+
+SORTS = (SORT_RELEVANCE, SORT_NEWEST, SORT_OLDEST)
+
+# hits are sorted by occurred alone, the only sortable column, ties are broken
+# by id afterwards (sorting by an id facet reads the postings of every id)
+_BY_OCCURRED = whoosh.sorting.FieldFacet('occurred')
+
+
+def _index_datetime(dt):
+    # datetimes stored in the index are naive UTC
+    if is_aware(dt):
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return dt
+
 
 class EventSetBySearch(EventSet):
 
     def __init__(self, index, pool, query, eventquery, pagesize, timezone=None,
-                 to_mask=None, to_filter=None, before=None, after=None):
+                 to_mask=None, to_filter=None, before=None, after=None,
+                 sort=SORT_NEWEST, results=None):
 
         super().__init__(pool, eventquery, pagesize, timezone=timezone)
 
+        if sort not in SORTS:
+            raise ValueError("unrecognized sort: '%s'" % (sort))
+
         self._index = index
+        self._results = results
 
         self._filter_terms = None
         self._mask_terms = None
 
-        self._metadata = SearchMetadata(0, None)
+        self._metadata = None
+
+        self.sort = sort
 
         self.query = query
 
@@ -186,27 +221,13 @@ class EventSetBySearch(EventSet):
                 [whoosh.query.Term("feed", str(feed)) for feed in to_mask]
             )
 
-        # build daterange filter
+        # build daterange filter (open ended unless both are provided, which
+        # also keeps the filter the same for repeated searches)
         if self.before is not None or self.after is not None:
-
-            # default after is a very early timestamp
-            after = (
-                self.after
-                if self.after is not None
-                else datetime.datetime.utcfromtimestamp(1)
-            )
-
-            # default before is the current timestamp
-            before = (
-                self.before
-                if self.before is not None
-                else datetime.datetime.utcnow()
-            )
-
             filter_term = whoosh.query.DateRange(
                 "occurred",
-                after,
-                before,
+                self.after,
+                self.before,
                 startexcl=True,
                 endexcl=True
             )
@@ -216,77 +237,248 @@ class EventSetBySearch(EventSet):
             else:
                 self._filter_terms &= filter_term
 
-        # determine metadata
-        self._search_metadata()
+    @property
+    def metadata(self):
+        # determined by the first page of newest results, or a search of its
+        # own if needed before (or instead of) that
+        if self._metadata is None:
+            key = ('metadata', self._parsed_query, self._filter_terms,
+                   self._mask_terms)
+
+            self._metadata = self._cached(key, self._search_metadata)
+
+        return self._metadata
 
     @property
     def latest(self):
-        if self._metadata.latest is not None:
-            return utc_datetime_to_local(self._metadata.latest, self.timezone)
+        if self.metadata.latest is not None:
+            return utc_datetime_to_local(self.metadata.latest, self.timezone)
 
     def _count(self):
-        return self._metadata.count
-
-    def _search_metadata(self, sortedby="occurred", reverse=True):
-        with self._index.searcher() as searcher:
-            # search!
-            hits = searcher.search_page(
-                self._parsed_query,
-                1,
-                filter=self._filter_terms,
-                mask=self._mask_terms,
-                pagelen=self.pagesize,
-                sortedby=sortedby,
-                reverse=reverse
+        return self.metadata.count
+
+    def _cached(self, key, search):
+        """Return the result of search(searcher), from the index result cache
+        if possible.
+
+        """
+        if self._results is None:
+            with self._index.searcher() as searcher:
+                return search(searcher)
+
+        # results are only valid for the index generation they came from (the
+        # modified time tells apart generations of a re-created index)
+        generation = (
+            self._index.latest_generation(),
+            self._index.last_modified()
+        )
+
+        result = self._results.get(generation, key)
+
+        if result is None:
+            with self._index.searcher() as searcher:
+                result = search(searcher)
+
+            self._results.set(generation, key, result)
+
+        return result
+
+    def _to_metadata(self, hits):
+        # hits of an unscored search sorted newest first, which are counted
+        # exactly, data stored in Whoosh is already UTC
+        return SearchMetadata(
+            len(hits),
+            hits[0]["occurred"] if hits else None
+        )
+
+    def _search_metadata(self, searcher):
+        hits = searcher.search(
+            self._parsed_query,
+            filter=self._filter_terms,
+            mask=self._mask_terms,
+            limit=1,
+            sortedby=_BY_OCCURRED,
+            reverse=True,
+            scored=False
+        )
+
+        return self._to_metadata(hits)
+
+    def _cursor_terms(self, occurred, event_id):
+        # matches hits following the cursor in (occurred, id) order, so
+        # every page is found by an equally cheap search
+        if self.sort == SORT_NEWEST:
+            before_or_after = whoosh.query.DateRange(
+                "occurred", None, occurred, endexcl=True
+            )
+            tied = whoosh.query.TermRange(
+                "id", None, event_id, endexcl=True
+            )
+        else:
+            before_or_after = whoosh.query.DateRange(
+                "occurred", occurred, None, startexcl=True
+            )
+            tied = whoosh.query.TermRange(
+                "id", event_id, None, startexcl=True
             )
 
-            if hits:
-                # data stored in Whooosh is already UTC
-                self._metadata = SearchMetadata(
-                    hits.total,
-                    hits[0]["occurred"]
-                )
+        return whoosh.query.Or([
+            before_or_after,
+            whoosh.query.And([
+                whoosh.query.DateRange("occurred", occurred, occurred),
+                tied
+            ])
+        ])
 
-    def _search_page(self):
+    def _search_by_relevance(self, searcher, page):
+        # search!
+        hits = searcher.search_page(
+            self._parsed_query,
+            page,
+            filter=self._filter_terms,
+            mask=self._mask_terms,
+            pagelen=self.pagesize
+        )
+
+        # whoosh returns the last page for page numbers past it
+        if page > max(hits.pagecount, 1):
+            raise InvalidPage
 
-        if self._cursor is None:
-            # set initial cursor
-            self._cursor = BySearchCursor(1)
+        following = page + 1 if page < hits.pagecount else None
 
-        with self._index.searcher() as searcher:
+        return [hit["id"] for hit in hits], following, None
 
-            # search!
-            hits = searcher.search_page(
-                self._parsed_query,
-                self._cursor.page,
+    def _search_by_occurred(self, searcher, position):
+
+        filter_terms = self._filter_terms
+
+        if position is not None:
+            if filter_terms is None:
+                filter_terms = self._cursor_terms(*position)
+            else:
+                filter_terms = filter_terms & self._cursor_terms(*position)
+
+        limit = self.pagesize + 1
+        newest = self.sort == SORT_NEWEST
+
+        # search! (fetching one extra hit to tell if there's a next page),
+        # scores aren't needed for sorting by time
+        hits = searcher.search(
+            self._parsed_query,
+            filter=filter_terms,
+            mask=self._mask_terms,
+            limit=limit,
+            sortedby=_BY_OCCURRED,
+            reverse=newest,
+            scored=False
+        )
+
+        metadata = None
+
+        if position is None and newest:
+            metadata = self._to_metadata(hits)
+
+        hits = [(hit["occurred"], hit["id"]) for hit in hits]
+
+        # the last hit may be one of several that occurred at the same time,
+        # any of which could have been cut off, so get all of them (by a query
+        # of their own, scored so that whoosh skips to the hits at that time
+        # rather than reading every hit)
+        if len(hits) == limit:
+            last = hits[-1][0]
+
+            tied = searcher.search(
+                self._parsed_query & whoosh.query.DateRange(
+                    "occurred", last, last
+                ),
                 filter=self._filter_terms,
                 mask=self._mask_terms,
-                pagelen=self.pagesize
+                limit=None
             )
 
-            if not hits and self._cursor.page == 1:
-                return []
-            elif not hits:
+            tied = [(hit["occurred"], hit["id"]) for hit in tied]
+
+            if position is not None:
+                tied = [
+                    h for h in tied
+                    if (h < position if newest else h > position)
+                ]
+
+            hits = [h for h in hits if h[0] != last] + tied
+
+        hits = sorted(hits, reverse=newest)[:limit]
+
+        if len(hits) > self.pagesize:
+            following = hits[self.pagesize - 1]
+        else:
+            following = None
+
+        return [i for _, i in hits[:self.pagesize]], following, metadata
+
+    def _search_page(self):
+
+        # results are found (and cached) by plain values, not the cursor
+        # objects handed out with pages
+        if self.sort == SORT_RELEVANCE:
+            if self._cursor is None:
+                position = 1
+            elif isinstance(self._cursor, BySearchCursor):
+                position = self._cursor.page
+            else:
+                raise InvalidPage
+
+            def search(searcher):
+                return self._search_by_relevance(searcher, position)
+        else:
+            if self._cursor is None:
+                position = None
+            elif isinstance(self._cursor, ByTimeRangeCursor):
+                position = (
+                    _index_datetime(self._cursor.occurred),
+                    self._cursor.id
+                )
+            else:
                 raise InvalidPage
 
-            event_ids = tuple([hit["id"] for hit in hits])
+            def search(searcher):
+                return self._search_by_occurred(searcher, position)
+
+        key = (self.sort, self._parsed_query, self._filter_terms,
+               self._mask_terms, self.pagesize, position)
+
+        event_ids, following, metadata = self._cached(key, search)
+
+        if metadata is not None and self._metadata is None:
+            self._metadata = metadata
 
-            events = {}
+        if following is None:
+            cursor = None
+        elif self.sort == SORT_RELEVANCE:
+            cursor = BySearchCursor(following)
+        else:
+            cursor = ByTimeRangeCursor(*following)
 
-            # get events from db
-            with self._pool.connect() as cur:
-                cur.execute(self._eventquery.query, (event_ids, ))
+        if not event_ids:
+            return [], cursor
 
-                # maintain ordering by score
-                for r in cur:
-                    e = Event.from_dict(r[0])
-                    events[e.id] = e
+        events = {}
 
-            return [events[i] for i in event_ids]
+        # get events from db
+        with self._pool.connect() as cur:
+            cur.execute(self._eventquery.query, (tuple(event_ids), ))
+
+            for r in cur:
+                e = Event.from_dict(r[0])
+                events[e.id] = e
+
+        # maintain ordering of hits
+        return [events[i] for i in event_ids], cursor
 
     def __iter__(self):
-        for _ in range(1, self.num_pages + 1):
-            yield from self.page()
+        self._cursor = None
+
+        for p in self.pages():
+            yield from p
 
     def page(self, cursor=None):
 
@@ -294,13 +486,6 @@ class EventSetBySearch(EventSet):
         if cursor is not None:
             self._cursor = cursor
 
-        events = self._search_page()
-
-        # increment page in cursor
-        self._cursor.page += 1
-
-        # indicate there is no next page, reset internal cursor
-        if self._cursor.page > self.num_pages:
-            self._cursor = None
+        events, self._cursor = self._search_page()
 
         return Page(events, self._cursor, timezone=self.timezone)
@@ -1,4 +1,7 @@
+import uuid
+import select
 import logging
+import threading
 
 from contextlib import contextmanager
 
@@ -11,18 +14,26 @@ _LOG = logging.getLogger(__name__)
 
 _MIN_RETRIES = 5
 
+_DEFAULT_TIMEOUT = 30
+
 
 psycopg2.extensions.register_adapter(dict, psycopg2.extras.Json)
 
 
 class Pool:
-    def __init__(self, min_conn, max_conn, database, user, password):
+    def __init__(self, min_conn, max_conn, database, user, password,
+                 timeout=_DEFAULT_TIMEOUT):
 
         self.database = database
         self.user = user
         self.password = password
         self.min_conn = min_conn
         self.max_conn = max_conn
+        self.timeout = timeout
+
+        # callers wait (up to timeout seconds) for one of max_conn connections
+        # to be returned, rather than failing with an exhausted pool
+        self._available = threading.BoundedSemaphore(max_conn)
 
         self._impl = psycopg2.pool.ThreadedConnectionPool(
             min_conn,
@@ -33,15 +44,35 @@ class Pool:
         )
 
     @contextmanager
-    def connect(self, dry=True, error_message="", dict_cursor=False):
-
-        conn = None
+    def connect(self, dry=True, error_message="", dict_cursor=False,
+                server_side=False):
 
         cursor_factory = None
+        cursor_name = None
 
         if dict_cursor:
             cursor_factory = psycopg2.extras.RealDictCursor
 
+        # named cursors are kept on the server, and rows are fetched from it
+        # in batches of cursor.itersize as the cursor is iterated
+        if server_side:
+            cursor_name = 'eventlog_%s' % (uuid.uuid4().hex)
+
+        if not self._available.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(
+                'no connection available after %ss' % (self.timeout)
+            )
+
+        try:
+            yield from self._connect(dry, error_message, cursor_factory,
+                                     cursor_name)
+        finally:
+            self._available.release()
+
+    def _connect(self, dry, error_message, cursor_factory, cursor_name):
+
+        conn = None
+
         # cap the retry attempts to the number of connections being kept by
         # the pool
         retries = self.min_conn or _MIN_RETRIES
@@ -73,7 +104,10 @@ class Pool:
                 conn = None
 
         try:
-            with conn.cursor(cursor_factory=cursor_factory) as cur:
+            with conn.cursor(
+                name=cursor_name,
+                cursor_factory=cursor_factory
+            ) as cur:
                 yield cur
 
             if not dry:
@@ -92,3 +126,39 @@ class Pool:
             raise
         finally:
             self._impl.putconn(conn)
+
+    def listen(self, channel, timeout=None):
+        """Generator yielding the list of payloads notified on channel since
+        the last iteration, or an empty list if none arrived within timeout
+        seconds.
+
+        A dedicated connection (outside of the pool) is held for as long as
+        the generator is open.
+
+        """
+        conn = psycopg2.connect(
+            database=self.database,
+            user=self.user,
+            password=self.password
+        )
+
+        try:
+            conn.autocommit = True
+
+            with conn.cursor() as cur:
+                cur.execute("listen %s" % (channel))
+
+            while True:
+                readable, _, _ = select.select([conn], [], [], timeout)
+
+                payloads = []
+
+                if readable:
+                    conn.poll()
+
+                    while conn.notifies:
+                        payloads.append(conn.notifies.pop(0).payload)
+
+                yield payloads
+        finally:
+            conn.close()
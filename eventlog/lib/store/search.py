@@ -1,17 +1,30 @@
 import os
 import logging
+import math
+import time
+import collections
+import contextlib
 
-from threading import RLock
+from threading import Lock, RLock
 
 from .eventset import EventSetBySearch
 
-from whoosh.index import open_dir, exists_in, create_in
+from whoosh.index import open_dir, exists_in, create_in, LockError
 from whoosh.fields import Schema, ID, TEXT, DATETIME
+from whoosh.query import Or, Term
+from whoosh.reading import SegmentReader, MultiReader, EmptyReader
+from whoosh.searching import Searcher
+from whoosh.writing import OPTIMIZE, CLEAR
 
 _LOG = logging.getLogger(__name__)
 
+# serializes writers within a process, whoosh's WRITELOCK file lock
+# serializes them across processes
 _LOCK = RLock()
 
+# seconds between attempts to take the WRITELOCK file lock
+_LOCK_DELAY = 0.25
+
 _SCHEMA = Schema(
     id=ID(unique=True, stored=True),
     feed=ID,
@@ -25,6 +38,98 @@ class NoIndexAvailable(Exception):
     pass
 
 
+class IndexLocked(Exception):
+    pass
+
+
+class ResultCache:
+    """Bounded LRU of search results, holding only those of the latest index
+    generation seen, so results are dropped as soon as the index changes (in
+    any process).
+
+    """
+    def __init__(self, size):
+        self._size = size
+        self._generation = None
+        self._entries = collections.OrderedDict()
+        self._lock = Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, generation, key):
+        with self._lock:
+            self._check_generation(generation)
+
+            result = self._entries.get(key)
+
+            if result is not None:
+                self._entries.move_to_end(key)
+
+            return result
+
+    def set(self, generation, key, result):
+        with self._lock:
+            self._check_generation(generation)
+
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+
+def tiered_merge(max_segments=10, factor=10):
+    """Returns a whoosh merge policy grouping segments into tiers by size
+    (document counts within the same power of factor), merging any tier which
+    has collected factor segments, and then the smallest segments until at
+    most max_segments remain.
+
+    """
+    def policy(writer, segments):
+        tiers = collections.defaultdict(list)
+
+        for segment in segments:
+            count = max(segment.doc_count_all(), 1)
+            tiers[int(math.log(count, factor))].append(segment)
+
+        merge = []
+        keep = []
+
+        for tier in tiers.values():
+            if len(tier) >= factor:
+                merge.extend(tier)
+            else:
+                keep.extend(tier)
+
+        # leave room for the segment being written
+        excess = len(keep) + 1 - max_segments
+
+        if excess > 0:
+            keep.sort(key=lambda segment: segment.doc_count_all())
+
+            merge.extend(keep[:excess])
+            keep = keep[excess:]
+
+        for segment in merge:
+            reader = SegmentReader(writer.storage, writer.schema, segment)
+            writer.add_reader(reader)
+            reader.close()
+
+        if merge:
+            _LOG.info("merging %d index segments", len(merge))
+
+        return keep
+
+    return policy
+
+
 def open_index(path, force_new=False):
 
     index = None
@@ -46,11 +151,38 @@ def open_index(path, force_new=False):
     return index
 
 
+def _update_documents(writer, event):
+    for doc in event.documents:
+        writer.update_document(**doc)
+
+    num_related = 0 if event.related is None else len(event.related)
+
+    _LOG.info("indexed %s and %d related events", str(event), num_related)
+
+
+def _delete_documents(writer, documents):
+    # in one pass over the index, rather than one per document
+    ids = sorted(set(doc['id'] for doc in documents))
+
+    writer.delete_by_query(Or([Term('id', i) for i in ids]))
+
+    _LOG.info("removed %d indexed events", len(ids))
+
+
+def _to_documents(events):
+    return [doc for e in events for doc in e.documents]
+
+
 class Index:
 
-    def __init__(self, index_dir):
+    def __init__(self, index_dir, cache_size=256, write_timeout=60,
+                 max_segments=10, merge_factor=10):
         self._indexref = None
         self._index_dir = index_dir
+        self._write_timeout = write_timeout
+        self._merge = tiered_merge(max_segments, merge_factor)
+
+        self._results = ResultCache(cache_size) if cache_size else None
 
     @property
     def _index(self):
@@ -66,36 +198,63 @@ class Index:
 
         self._indexref = open_index(path, force_new=True)
 
-    def index(self, events, dry=False):
-        # if no index initialized, do nothing
-        if self._index is None or len(events) == 0:
-            return
-
-        _LOCK.acquire()
+        if self._results is not None:
+            self._results.clear()
 
-        writer = self._index.writer()
+    @contextlib.contextmanager
+    def _writer(self, dry=False, mergetype=None):
+        """Context manager yielding the index writer, once both this process'
+        lock and the index's file lock (shared by every process writing to
+        INDEX_DIR) are held, waiting at most write_timeout seconds for them.
 
-        for e in events:
-            for doc in e.documents:
-                writer.update_document(**doc)
+        Changes are committed on exit, merging segments according to mergetype
+        (the index's merge policy by default), or cancelled if dry or the
+        block raises; the locks are released either way.
 
-            num_related = 0 if e.related is None else len(e.related)
+        """
+        deadline = time.monotonic() + self._write_timeout
 
-            _LOG.info(
-                "indexed %s and %d related events",
-                str(e),
-                num_related
+        if not _LOCK.acquire(timeout=self._write_timeout):
+            raise IndexLocked(
+                "timed out waiting for index writer at '%s'" % self._index_dir
             )
 
-        if not dry:
-            writer.commit()
-            _LOG.info("index updates committed")
-        else:
-            writer.cancel()
+        try:
+            try:
+                writer = self._index.writer(
+                    timeout=max(deadline - time.monotonic(), 0),
+                    delay=_LOCK_DELAY
+                )
+            except LockError:
+                raise IndexLocked(
+                    "index at '%s' locked by another writer" % self._index_dir
+                )
+
+            try:
+                yield writer
+            except BaseException:
+                writer.cancel()
+                raise
 
-        _LOCK.release()
+            if not dry:
+                writer.commit(mergetype=mergetype or self._merge)
+                _LOG.info("index changes committed")
+            else:
+                writer.cancel()
 
-    def remove(self, events=None, feed=None, dry=False):
+        finally:
+            _LOCK.release()
+
+    def index(self, events, dry=False):
+        # if no index initialized, do nothing
+        if self._index is None or len(events) == 0:
+            return
+
+        with self._writer(dry=dry) as writer:
+            for e in events:
+                _update_documents(writer, e)
+
+    def remove(self, events=None, feed=None, dry=False, documents=None):
         # if no index initialized, do nothing
         if self._index is None:
             _LOG.debug(
@@ -103,49 +262,221 @@ class Index:
             )
             return
 
-        if events is None and feed is None:
+        if events is not None:
+            documents = _to_documents(events)
+
+        if not documents and feed is None:
             _LOG.debug('received nothing to remove')
             return
 
-        _LOCK.acquire()
+        with self._writer(dry=dry) as writer:
+            if documents:
+                _delete_documents(writer, documents)
 
-        writer = self._index.writer()
+            elif feed is not None:
+                writer.delete_by_term('feed', feed)
+                _LOG.info("removed all documents for feed '%s'", feed)
+
+    def optimize(self, dry=False):
+        """Merges all segments into one. Searches continue against the
+        current segments until the merge is committed, but other writers wait
+        for it to complete.
+
+        """
+        if self._index is None:
+            return
+
+        with self._writer(dry=dry, mergetype=OPTIMIZE):
+            _LOG.info("optimizing index at '%s'", self._index_dir)
+
+    def search(self, query, eventquery, pool, pagesize, **kwargs):
+
+        if self._index is None:
+            return None
+
+        return EventSetBySearch(
+            self._index,
+            pool,
+            query,
+            eventquery,
+            pagesize,
+            results=self._results,
+            **kwargs
+        )
+
+
+class _Shards:
+    """The shards searched by an EventSetBySearch, presented as a single
+    whoosh index.
+
+    Generations are those of all shards, so that cached results for any
+    combination of shards are dropped as soon as one of them changes.
+
+    """
+    schema = _SCHEMA
+
+    def __init__(self, searched, shards):
+        self._searched = searched
+        self._shards = shards
+
+    def searcher(self):
+        readers = []
+
+        # empty shards can't be sorted as part of a MultiReader, so leave
+        # them out
+        for ix in self._searched:
+            reader = ix.reader()
+
+            if reader.doc_count_all():
+                readers.append(reader)
+            else:
+                reader.close()
+
+        if not readers:
+            reader = EmptyReader(_SCHEMA)
+        elif len(readers) == 1:
+            reader = readers[0]
+        else:
+            reader = MultiReader(readers)
+
+        return Searcher(reader)
+
+    def latest_generation(self):
+        return tuple(ix.latest_generation() for ix in self._shards)
+
+    def last_modified(self):
+        return tuple(ix.last_modified() for ix in self._shards)
+
+
+class ShardedIndex:
+    """Search index split into an Index per feed, kept in subdirectories of
+    index_dir named by feed short name.
+
+    Searches read only the shards of the feeds they include (through a single
+    searcher, so relevance is scored across all of them alike), and removing
+    a feed just empties its shard.
+
+    """
+    def __init__(self, index_dir, cache_size=256, **kwargs):
+        self._index_dir = index_dir
+        self._shard_kwargs = kwargs
+        self._shards = {}
+        self._lock = Lock()
+
+        self._results = ResultCache(cache_size) if cache_size else None
+
+    def _names(self):
+        # shards may be created by other processes, so always check
+        if not os.path.isdir(self._index_dir):
+            return []
+
+        return sorted(
+            name for name in os.listdir(self._index_dir)
+            if os.path.isdir(os.path.join(self._index_dir, name))
+        )
+
+    def _shard(self, name):
+        with self._lock:
+            shard = self._shards.get(name)
+
+            if shard is None:
+                os.makedirs(self._index_dir, exist_ok=True)
+
+                shard = Index(
+                    os.path.join(self._index_dir, name),
+                    cache_size=0,
+                    **self._shard_kwargs
+                )
+
+                self._shards[name] = shard
+
+            return shard
+
+    def clear(self, path=None):
+
+        if path is not None and path != self._index_dir:
+            self._index_dir = path
+            self._shards = {}
+
+        for name in self._names():
+            self._shard(name).clear()
+
+        if self._results is not None:
+            self._results.clear()
+
+    def _writers(self, stack, names, dry):
+        # opens writers on the named shards, all committed (or cancelled) when
+        # the stack exits, in sorted order so that processes writing to the
+        # same shards can't each hold one the other is waiting on
+        return {
+            name: stack.enter_context(self._shard(name)._writer(dry=dry))
+            for name in sorted(names)
+        }
+
+    def index(self, events, dry=False):
+
+        events = list(events)
+
+        with contextlib.ExitStack() as stack:
+            writers = self._writers(
+                stack, set(e.feed['short_name'] for e in events), dry
+            )
 
-        if events is not None:
             for e in events:
-                for doc in e.documents:
-                    writer.delete_by_term('id', doc['id'])
+                _update_documents(writers[e.feed['short_name']], e)
+
+    def remove(self, events=None, feed=None, dry=False, documents=None):
+
+        if events is not None:
+            documents = _to_documents(events)
+
+        if not documents and feed is None:
+            _LOG.debug('received nothing to remove')
+            return
+
+        if documents:
+            by_feed = collections.defaultdict(list)
 
-                num_related = 0 if e.related is None else len(e.related)
+            for doc in documents:
+                by_feed[doc['feed']].append(doc)
 
-                _LOG.info(
-                    "remove indexed %s and %d related events",
-                    str(e),
-                    num_related
+            with contextlib.ExitStack() as stack:
+                writers = self._writers(
+                    stack, set(by_feed) & set(self._names()), dry
                 )
 
-        elif feed is not None:
-            writer.delete_by_term('feed', feed)
-            _LOG.info("removed all documents for feed '%s'", feed)
+                for name, writer in writers.items():
+                    _delete_documents(writer, by_feed[name])
 
-        if not dry:
-            writer.commit()
-            _LOG.info("index removals committed")
-        else:
-            writer.cancel()
+        elif feed in self._names():
+            with self._shard(feed)._writer(dry=dry, mergetype=CLEAR):
+                _LOG.info("removed all documents for feed '%s'", feed)
 
-        _LOCK.release()
+    def optimize(self, dry=False):
+        for name in self._names():
+            self._shard(name).optimize(dry=dry)
 
     def search(self, query, eventquery, pool, pagesize, **kwargs):
 
-        if self._index is None:
-            return None
+        shards = {name: self._shard(name)._index for name in self._names()}
+
+        # only open the shards of feeds which can match
+        names = set(shards)
+
+        if kwargs.get('to_filter') is not None:
+            names &= set(map(str, kwargs['to_filter']))
+
+        if kwargs.get('to_mask') is not None:
+            names -= set(map(str, kwargs['to_mask']))
+
+        searched = [ix for name, ix in shards.items() if name in names]
 
         return EventSetBySearch(
-            self._index,
+            _Shards(searched, list(shards.values())),
             pool,
             query,
             eventquery,
             pagesize,
+            results=self._results,
             **kwargs
         )
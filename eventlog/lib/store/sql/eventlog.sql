@@ -38,4 +38,11 @@ CREATE TABLE related_events (
     PRIMARY KEY(parent, child)
 );
 
-CREATE INDEX related_events_by_parent ON related_events(parent);
\ No newline at end of file
+CREATE INDEX related_events_by_parent ON related_events(parent);
+CREATE INDEX related_events_by_child ON related_events(child);
+
+CREATE TABLE generations (
+    feed_id int PRIMARY KEY references feeds(id),
+    generation bigint NOT NULL DEFAULT 0,
+    modified timestamptz NOT NULL DEFAULT now()
+);
@@ -1,16 +1,20 @@
 import sys
 import re
 import copy
+import time
+import weakref
 import difflib
+import threading
+import collections
 
-from flask import request, current_app
+from flask import g, request, current_app
 from flask.signals import got_request_exception
 
 from werkzeug.exceptions import HTTPException
 
 from flask_restful import Api as _Api
 from flask_restful import abort, _handle_flask_propagate_exceptions_config
-from flask_restful.reqparse import Argument as _Argument
+from flask_restful.reqparse import Argument as _Argument, RequestParser
 from flask_restful.utils import http_status_message, cors
 
 envelope = {
@@ -31,9 +35,105 @@ pagination = {
     "pagination": {}
 }
 
+# longer (i.e. scanner generated) paths are never matched against routes
+_MAX_SUGGEST_PATH = 128
+
+
+class RouteSuggestions:
+    """Close matches among an application's URL rules for request paths
+    that weren't found.
+
+    Matches are memoized per path (up to size paths), and at most rate new
+    paths per second are matched, beyond which no suggestions are made.
+
+    """
+    def __init__(self, url_map, size=1024, rate=None):
+        self._rules = dict(
+            [
+                (re.sub('(<.*>)', '', rule.rule), rule.rule)
+                for rule in url_map.iter_rules()
+            ]
+        )
+
+        self._size = size
+        self._rate = rate
+        self._memo = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        # token bucket refilled at rate tokens per second
+        self._allowance = rate
+        self._last_check = time.monotonic()
+
+    def _is_allowed(self):
+        if self._rate is None:
+            return True
+
+        now = time.monotonic()
+
+        self._allowance = min(
+            self._rate,
+            self._allowance + (now - self._last_check) * self._rate
+        )
+        self._last_check = now
+
+        if self._allowance < 1:
+            return False
+
+        self._allowance -= 1
+
+        return True
+
+    def get(self, path):
+        if len(path) > _MAX_SUGGEST_PATH:
+            return []
+
+        with self._lock:
+            if path in self._memo:
+                self._memo.move_to_end(path)
+
+                return self._memo[path]
+
+            if not self._is_allowed():
+                return []
+
+        suggestions = [
+            self._rules[match]
+            for match in difflib.get_close_matches(path, self._rules.keys())
+        ]
+
+        with self._lock:
+            self._memo[path] = suggestions
+
+            while len(self._memo) > self._size:
+                self._memo.popitem(last=False)
+
+        return suggestions
+
 
 class Api(_Api):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._suggestions = weakref.WeakKeyDictionary()
+
+    def suggestions(self):
+        """Return the route suggestions for the current application, built
+        on first use.
+
+        """
+        app = current_app._get_current_object()
+
+        suggestions = self._suggestions.get(app)
+
+        if suggestions is None:
+            suggestions = self._suggestions[app] = RouteSuggestions(
+                app.url_map,
+                rate=app.config.get('ERROR_404_HELP_RATE', 10)
+            )
+
+        return suggestions
+
     def handle_error(self, e):
         """Error handler for the API transforms a raised exception into a
         Flask response, with the appropriate HTTP status code and body.
@@ -74,16 +174,7 @@ class Api(_Api):
 
         help_on_404 = current_app.config.get("ERROR_404_HELP", True)
         if code == 404 and help_on_404:
-            rules = dict(
-                [
-                    (re.sub('(<.*>)', '', rule.rule), rule.rule)
-                    for rule in current_app.url_map.iter_rules()
-                ]
-            )
-
-            close_matches = difflib.get_close_matches(
-                request.path, rules.keys()
-            )
+            close_matches = self.suggestions().get(request.path)
 
             if close_matches:
                 # If we already have a message, add punctuation and
@@ -96,7 +187,7 @@ class Api(_Api):
                 data['message'] += (
                     'You have requested this URI [' + request.path +
                     '] but did you mean ' +
-                    ' or '.join((rules[match] for match in close_matches)) +
+                    ' or '.join(close_matches) +
                     ' ?'
                 )
 
@@ -127,7 +218,58 @@ class Argument(_Argument):
             raise type(e)(message)
 
     def handle_validation_error(self, error, bundle_errors):
-        abort(400, message=str(error))
+        message = str(error)
+
+        # i.e. invalid choices, which aren't described by convert
+        if not message.startswith('Invalid'):
+            message = "Invalid value for '%s': %s" % (self.name, message)
+
+        abort(400, message=message)
+
+
+class Schema:
+    """Request arguments accepted by a resource.
+
+    The provided build function is called with the application config and
+    should return the arguments to accept as (name, options) pairs. These
+    are compiled into a RequestParser once per application, rather than on
+    every request.
+
+    """
+    def __init__(self, build):
+        self._build = build
+        self._parsers = weakref.WeakKeyDictionary()
+
+    def compile(self, config):
+        parser = RequestParser(argument_class=Argument)
+
+        for name, options in self._build(config):
+            parser.add_argument(name, location='args', **options)
+
+        return parser
+
+    @property
+    def parser(self):
+        app = current_app._get_current_object()
+
+        parser = self._parsers.get(app)
+
+        if parser is None:
+            parser = self._parsers[app] = self.compile(app.config)
+
+        return parser
+
+    def parse_args(self):
+        return self.parser.parse_args()
+
+
+def parse_args(parser):
+    # arguments are parsed at most once per request, the result is shared by
+    # the cache key and the resource method
+    if 'args' not in g:
+        g.args = parser.parse_args()
+
+    return g.args
 
 
 api = Api(catch_all_404s=True, decorators=[cors.crossdomain(origin='*')])
@@ -1,14 +1,52 @@
+import time
 import string
 import random
+import functools
+import threading
+import collections
 
-from flask import current_app, request
+from flask import g, current_app, request
 
 from itsdangerous import URLSafeTimedSerializer as Serializer
 from itsdangerous import SignatureExpired, BadSignature, BadData
 
+# signing timestamps of recently verified tokens, keyed by (secret, token)
+# and kept in least to most recently used order
+_VERIFIED = collections.OrderedDict()
+_VERIFIED_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _serializer(secret_key):
+    return Serializer(secret_key)
+
+
+def _verified_timestamp(key):
+    with _VERIFIED_LOCK:
+        timestamp = _VERIFIED.get(key)
+
+        if timestamp is not None:
+            _VERIFIED.move_to_end(key)
+
+        return timestamp
+
+
+def _remember_verified(key, timestamp, max_size):
+    with _VERIFIED_LOCK:
+        _VERIFIED[key] = timestamp
+        _VERIFIED.move_to_end(key)
+
+        while len(_VERIFIED) > max_size:
+            _VERIFIED.popitem(last=False)
+
+
+def _forget_verified(key):
+    with _VERIFIED_LOCK:
+        _VERIFIED.pop(key, None)
+
 
 def generate_auth_token():
-    s = Serializer(current_app.config['SECRET_KEY'])
+    s = _serializer(current_app.config['SECRET_KEY'])
 
     return s.dumps(
         ''.join(random.choice(string.ascii_uppercase) for i in range(12))
@@ -16,12 +54,27 @@ def generate_auth_token():
 
 
 def verify_auth_token(token):
-    s = Serializer(current_app.config['SECRET_KEY'])
+    secret_key = current_app.config['SECRET_KEY']
 
     max_age = current_app.config['AUTH_TOKEN_EXPIRY']
 
+    key = (secret_key, token)
+
+    # a token whose signature was already checked only needs its age checked
+    timestamp = _verified_timestamp(key)
+
+    if timestamp is not None:
+        if time.time() - timestamp <= max_age:
+            return True
+
+        _forget_verified(key)
+
+        return False  # valid token, but expired
+
+    s = _serializer(secret_key)
+
     try:
-        s.loads(token, max_age=max_age)
+        _, signed = s.loads(token, max_age=max_age, return_timestamp=True)
     except SignatureExpired:  # pragma: no cover
         return False  # valid token, but expired
     except BadSignature:
@@ -31,6 +84,12 @@ def verify_auth_token(token):
     except Exception:  # pragma: no cover
         return False
 
+    _remember_verified(
+        key,
+        signed.timestamp(),
+        current_app.config.get('AUTH_TOKEN_CACHE_SIZE', 1024)
+    )
+
     return True
 
 
@@ -45,9 +104,13 @@ def parse_token(s):
 
 def is_authorized():
 
-    token = parse_token(request.headers.get('Authorization', ''))
+    # only verify the request token once per request
+    if 'authorized' not in g:
+        token = parse_token(request.headers.get('Authorization', ''))
 
-    if token is None:
-        return False
-    else:
-        return verify_auth_token(token)
+        if token is None:
+            g.authorized = False
+        else:
+            g.authorized = verify_auth_token(token)
+
+    return g.authorized
@@ -0,0 +1,118 @@
+import time
+import queue
+import logging
+import threading
+import contextlib
+
+from eventlog.service.core.store import store
+
+_LOG = logging.getLogger(__name__)
+
+# seconds between checks for remaining subscribers while no events are added
+_LISTEN_TIMEOUT = 5
+
+# seconds to wait before listening again after a failure
+_RETRY_INTERVAL = 5
+
+# number of unread notifications a subscriber may fall behind by
+_MAX_PENDING = 100
+
+
+class Subscription:
+    def __init__(self, maxsize=_MAX_PENDING):
+        self._queue = queue.Queue(maxsize)
+
+        # set if events had to be dropped because the subscriber was too slow
+        self.overflowed = False
+
+    def put(self, events):
+        try:
+            self._queue.put_nowait(events)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Return the next list of added events, raising queue.Empty if none
+        arrive within timeout seconds.
+
+        """
+        return self._queue.get(timeout=timeout)
+
+
+class Broadcaster:
+    """Fans out newly added events to all subscribers in this process.
+
+    A single listener thread (running only while there are subscribers)
+    holds the store's notification connection and looks up each batch of
+    added events once, regardless of the number of subscribers.
+
+    """
+    def __init__(self, store):
+        self._store = store
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        subscription = Subscription()
+
+        with self._lock:
+            self._subscribers.add(subscription)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.put(events)
+
+    def _has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def _is_needed(self):
+        # the only place the listener thread decides to stop, so subscribe
+        # never sees a running thread that is about to exit
+        with self._lock:
+            if not self._subscribers:
+                self._thread = None
+
+            return self._thread is not None
+
+    def _run(self):
+        while self._is_needed():
+            try:
+                self._listen()
+            except Exception:
+                _LOG.exception(
+                    'listening for added events failed, retrying in %ds',
+                    _RETRY_INTERVAL
+                )
+
+                time.sleep(_RETRY_INTERVAL)
+
+    def _listen(self):
+        listener = self._store.listen_events(timeout=_LISTEN_TIMEOUT)
+
+        with contextlib.closing(listener):
+            for ids in listener:
+                if ids:
+                    es = self._store.get_events_by_ids(ids, pagesize=len(ids))
+
+                    self.publish(list(es))
+
+                if not self._has_subscribers():
+                    return
+
+
+broadcaster = Broadcaster(store)
@@ -1,13 +1,304 @@
-from flask import request
+import math
+import time
+import logging
+import hashlib
+import functools
+import threading
+import urllib.parse
+
+from flask import g, request, current_app
 
 from flask_caching import Cache
+from flask_caching.backends import NullCache
+
+from werkzeug.exceptions import HTTPException
 
+from eventlog.service.core.api import parse_args
+from eventlog.service.core.store import store
 from eventlog.service.core.auth import is_authorized
+from eventlog.service.core.compression import encode, respond, negotiate
+
+_LOG = logging.getLogger(__name__)
+
+# how often to check for a result computed by another process
+_POLL_INTERVAL = 0.05
 
 cache = Cache()
 
 
-def make_cache_key():
-    key = request.path + '?' + request.query_string.decode('utf-8')
+def get_generations():
+    # look up store generations at most once per request, from the database
+    # (a row per feed) rather than the cache backend, which isn't shared with
+    # the processes writing events
+    if 'generations' not in g:
+        g.generations = store.get_generations()
+
+    return g.generations
+
+
+def requested_generations():
+    generations = get_generations()
+
+    requested = request.args.get('feeds')
+
+    if requested:
+        names = set(v.strip() for v in requested.split(','))
+
+        generations = {
+            k: v for k, v in generations.items() if k in names
+        }
+
+    return generations
+
+
+def generation_key():
+    generations = requested_generations()
+
+    key = ','.join(
+        '%s:%d' % (short_name, generations[short_name][0])
+        for short_name in sorted(generations)
+    )
+
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def canonical_items(name, value):
+    if isinstance(value, list):
+        return [(name, str(v)) for v in sorted(set(value))]
+
+    return [(name, str(value))]
+
+
+def canonical_query(resource):
+    try:
+        args = parse_args(resource.parser)
+    except HTTPException:
+        # invalid arguments are rejected by the resource itself
+        return request.query_string.decode('utf-8')
+
+    # parsed arguments have defaults applied and values normalized, so
+    # equivalent query strings produce the same key, and are escaped, so
+    # different ones never do
+    return urllib.parse.urlencode([
+        item
+        for name, value in sorted(args.items()) if value is not None
+        for item in canonical_items(name, value)
+    ])
+
+
+def is_storing():
+    # i.e. entries are kept for other requests, which may negotiate any
+    # content coding
+    return not isinstance(cache.cache, NullCache)
+
+
+def make_cache_key(resource=None, *args, **kwargs):
+    if 'cache_key' in g:
+        return g.cache_key
+
+    if resource is not None and hasattr(resource, 'parser'):
+        query = canonical_query(resource)
+    else:
+        query = request.query_string.decode('utf-8')
+
+    key = request.path + '?' + query
     key += 'authenticated' if is_authorized() else ''
+
+    # writes to any of the requested feeds bump their generation, so cached
+    # entries from before the write are never looked up again
+    key += '@' + generation_key()
+
+    g.cache_key = key
+
     return key
+
+
+class Flight:
+    """A computation of a cache entry that concurrent requests for the same
+    cache key can wait on instead of repeating it.
+
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_FLIGHTS = {}
+_FLIGHTS_LOCK = threading.Lock()
+
+
+def _join_flight(key):
+    # returns the flight for key, and whether the caller should lead it
+    with _FLIGHTS_LOCK:
+        flight = _FLIGHTS.get(key)
+
+        if flight is not None:
+            return flight, False
+
+        flight = _FLIGHTS[key] = Flight()
+
+        return flight, True
+
+
+def _end_flight(key, flight):
+    with _FLIGHTS_LOCK:
+        del _FLIGHTS[key]
+
+    flight.done.set()
+
+
+def _lead_flight(key, flight, compute):
+    try:
+        flight.value = compute()
+
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        _end_flight(key, flight)
+
+
+def _wait_flight(flight, timeout):
+    if not flight.done.wait(timeout):
+        return False, None
+
+    if flight.error is not None:
+        raise flight.error
+
+    return True, flight.value
+
+
+def _get_entry(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        _LOG.exception('unable to get cache entry')
+        return None
+
+
+def _set_entry(key, entry, timeout):
+    try:
+        cache.set(key, entry, timeout=timeout)
+    except Exception:
+        _LOG.exception('unable to set cache entry')
+
+
+def _fresh_until(timeout):
+    return None if not timeout else time.time() + timeout
+
+
+def cached(f):
+    """Decorator caching the result of a resource method under its
+    make_cache_key key.
+
+    Entries hold the serialized response body along with its compressed
+    forms, so a hit is answered with the bytes for the negotiated content
+    coding as is. With the null cache backend, only the negotiated coding is
+    compressed.
+
+    Concurrent misses for the same key (in this process, and in others
+    sharing the cache backend) wait on a single computation of the entry.
+    With CACHE_STALE_WHILE_REVALIDATE set, expired entries are kept for that
+    many extra seconds and served to other requests while one request
+    refreshes them.
+
+    """
+    def produce(stored, resource, *args, **kwargs):
+        # only entries that are stored are worth compressing in every coding
+        encodings = None if stored else [negotiate()]
+
+        return encode(f(resource, *args, **kwargs), encodings)
+
+    @functools.wraps(f)
+    def decorated(resource, *args, **kwargs):
+        return respond(lookup(resource, *args, **kwargs))
+
+    def lookup(resource, *args, **kwargs):
+        key = make_cache_key(resource, *args, **kwargs)
+        lock_key = key + ':lock'
+
+        config = current_app.config
+
+        timeout = config.get('CACHE_DEFAULT_TIMEOUT') or 0
+        stale_timeout = config.get('CACHE_STALE_WHILE_REVALIDATE') or 0
+        lock_timeout = config.get('CACHE_LOCK_TIMEOUT', 10)
+
+        # cache timeouts are in whole seconds
+        lock_ttl = int(math.ceil(lock_timeout))
+
+        def compute(locked=True):
+            try:
+                value = produce(is_storing(), resource, *args, **kwargs)
+
+                _set_entry(
+                    key,
+                    (value, _fresh_until(timeout)),
+                    (timeout + stale_timeout) if timeout else 0
+                )
+            finally:
+                # only release the lock if it's ours
+                if locked:
+                    cache.delete(lock_key)
+
+            return value
+
+        entry = _get_entry(key)
+
+        if entry is not None:
+            value, fresh_until = entry
+
+            if fresh_until is None or time.time() < fresh_until:
+                return value
+
+            # stale, unless this request gets to refresh the entry, serve it
+            flight, leader = _join_flight(key)
+
+            if not leader:
+                return value
+
+            if not cache.add(lock_key, True, timeout=lock_ttl):
+                # another process is refreshing it
+                flight.value = value
+                _end_flight(key, flight)
+
+                return value
+
+            return _lead_flight(key, flight, compute)
+
+        flight, leader = _join_flight(key)
+
+        if not leader:
+            done, value = _wait_flight(flight, lock_timeout)
+
+            if done:
+                return value
+
+            # waited long enough, compute it ourselves
+            return produce(False, resource, *args, **kwargs)
+
+        def compute_once():
+            # another process may already be computing this entry
+            deadline = time.time() + lock_timeout
+
+            locked = cache.add(lock_key, True, timeout=lock_ttl)
+
+            while not locked:
+                if time.time() >= deadline:
+                    break
+
+                time.sleep(_POLL_INTERVAL)
+
+                entry = _get_entry(key)
+
+                if entry is not None:
+                    return entry[0]
+
+                locked = cache.add(lock_key, True, timeout=lock_ttl)
+
+            return compute(locked)
+
+        return _lead_flight(key, flight, compute_once)
+
+    return decorated
@@ -0,0 +1,76 @@
+import gzip
+import functools
+
+from flask import g, request, current_app
+
+from flask_restful.representations.json import output_json
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# content codings the API can respond with, in order of preference
+ENCODERS = {}
+
+if brotli is not None:  # pragma: no cover
+    ENCODERS['br'] = functools.partial(brotli.compress, quality=5)
+
+ENCODERS['gzip'] = functools.partial(gzip.compress, compresslevel=6)
+
+
+def negotiate():
+    """Return the preferred content coding acceptable to the client, or
+    'identity' if there are none.
+
+    """
+    if 'encoding' not in g:
+        g.encoding = 'identity'
+
+        for name in ENCODERS:
+            if request.accept_encodings.quality(name) > 0:
+                g.encoding = name
+                break
+
+    return g.encoding
+
+
+def encode(data, encodings=None):
+    """Serialize data as a JSON response body, returning it along with its
+    compressed forms keyed by content coding, in every coding or only those
+    in encodings.
+
+    """
+    body = output_json(data, 200).get_data()
+
+    encoded = {'identity': body}
+
+    for name, compress in ENCODERS.items():
+        if encodings is None or name in encodings:
+            encoded[name] = compress(body)
+
+    return encoded
+
+
+def respond(encoded):
+    """Build a response from an encode result, with no further
+    serialization or compression.
+
+    """
+    encoding = negotiate()
+
+    # i.e. entries cached before an encoder became available
+    if encoding not in encoded:
+        encoding = 'identity'
+
+    response = current_app.response_class(
+        encoded[encoding],
+        mimetype='application/json'
+    )
+
+    if encoding != 'identity':
+        response.content_encoding = encoding
+
+    response.vary.add('Accept-Encoding')
+
+    return response
@@ -0,0 +1,81 @@
+import hashlib
+import functools
+
+from flask import request, current_app
+
+from werkzeug.http import http_date
+
+from eventlog.service.core.caching import (make_cache_key,
+                                           requested_generations)
+from eventlog.service.core.compression import negotiate
+
+
+def validators(resource):
+    # the cache key already captures the request, its authorization and the
+    # generations of the requested feeds
+    etag = hashlib.md5(make_cache_key(resource).encode('utf-8')).hexdigest()
+
+    modified = [m for _, m in requested_generations().values() if m]
+
+    last_modified = max(modified) if modified else None
+
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since is not None and last_modified is not None:
+        # HTTP dates have a one second resolution
+        return last_modified.replace(microsecond=0) <= (
+            request.if_modified_since
+        )
+
+    return False
+
+
+def conditional(f):
+    """Decorator adding ETag and Last-Modified headers to a resource method,
+    responding with 304 Not Modified (without calling the method) when the
+    request's validators show the client copy is still current.
+
+    Validators are derived from the store generations of the requested
+    feeds, which change whenever events for those feeds are written, and
+    again once they're indexed, so search results from before the index was
+    written aren't validated by them. The ETag is weak for compressed
+    responses, as it is shared by all of their content codings.
+
+    """
+    @functools.wraps(f)
+    def decorated(resource, *args, **kwargs):
+        etag, last_modified = validators(resource)
+
+        headers = {'ETag': '"%s"' % (etag)}
+
+        if negotiate() != 'identity':
+            headers['ETag'] = 'W/' + headers['ETag']
+
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified)
+
+        if is_not_modified(etag, last_modified):
+            response = current_app.response_class(status=304, headers=headers)
+
+            # as the full response would have
+            response.vary.add('Accept-Encoding')
+
+            return response
+
+        result = f(resource, *args, **kwargs)
+
+        if isinstance(result, current_app.response_class):
+            result.headers.update(headers)
+
+            return result
+
+        # let flask-restful build the response from the returned data
+        return result, 200, headers
+
+    return decorated
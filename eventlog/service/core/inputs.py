@@ -1,8 +1,6 @@
 import datetime
 import pytz
 
-from flask import current_app
-
 from eventlog.lib.events import DATEFMT
 
 
@@ -10,13 +8,16 @@ DATETIME_FMT = DATEFMT.replace('%z', '')
 DATE_FMT = "%Y-%m-%d"
 
 
-def limit(value):
-    max_allowed = current_app.config['PAGE_SIZE_MAX']
-    value = int(value)
-    if not (0 < value <= max_allowed):
-        raise ValueError("valid range is 0 < limit <= %d" % (max_allowed))
+def limit(max_allowed):
+
+    def limit(value):
+        value = int(value)
+        if not (0 < value <= max_allowed):
+            raise ValueError("valid range is 0 < limit <= %d" % (max_allowed))
 
-    return value
+        return value
+
+    return limit
 
 
 def comma_separated(value):
@@ -46,7 +47,6 @@ def date_format(value):
 
 def tz(value):
     try:
-        pytz.timezone(value)
-        return value
+        return pytz.timezone(value).zone
     except pytz.exceptions.UnknownTimeZoneError:
         raise ValueError("unrecognized timezone '%s'" % (value))
@@ -1,19 +1,25 @@
 import copy
+import json
+import queue
 import datetime
 
-from flask import current_app, url_for
-from flask_restful import reqparse, abort, Resource
+from flask import current_app, url_for, Response, stream_with_context
+from flask_restful import abort, Resource
 
 from eventlog.service.core.store import store
-from eventlog.service.core.api import api, envelope, pagination, Argument
+from eventlog.service.core.api import (api, envelope, pagination, Schema,
+                                       parse_args)
 from eventlog.service.core.auth import is_authorized
-from eventlog.service.core.caching import cache, make_cache_key
+from eventlog.service.core.broadcast import broadcaster
+from eventlog.service.core.caching import cached
+from eventlog.service.core.conditional import conditional
 from eventlog.service.core.inputs import (limit, comma_separated, tz,
                                           datetime_format, date_format,
                                           DATETIME_FMT, DATE_FMT)
 
 import eventlog.service.core.cursor
 
+from eventlog.lib.store.eventset import SORTS, SORT_NEWEST, SORT_RELEVANCE
 from eventlog.lib.store.pagination import InvalidPage
 
 
@@ -34,6 +40,10 @@ def to_query_params(args, cursor):
 
     remaining = [(k, v) for k, v in args.items() if k not in params]
 
+    # sort only applies to search queries
+    if not args.q:
+        remaining = [(k, v) for k, v in remaining if k != 'sort']
+
     # convert arguments back into query parameters
     for name, value in remaining:
         if isinstance(value, list):
@@ -50,22 +60,108 @@ def to_query_params(args, cursor):
     return querystring
 
 
+def events_arguments(config):
+    return [
+        ('tz', {
+            'type': tz,
+            'help': 'specify timezone as IANA info key for date values'
+        })
+    ]
+
+
+def events_list_arguments(config):
+    return [
+        ('limit', {
+            'type': limit(config['PAGE_SIZE_MAX']),
+            'help': 'number of events to retrieve',
+            'default': config['PAGE_SIZE_DEFAULT']
+        }),
+        ('feeds', {
+            'type': comma_separated,
+            'help': 'filter events by specific feed(s)'
+        }),
+        ('q', {
+            'type': str,
+            'help': 'filter events by search query'
+        }),
+        ('sort', {
+            'choices': SORTS,
+            'help': ('specify order of search query results, by relevance, '
+                     'or by occurred datetime (default=newest)'),
+            'default': SORT_NEWEST
+        }),
+        ('ids', {
+            'type': comma_separated,
+            'help': 'fetch specific event(s) by ID'
+        }),
+        ('embed_related', {
+            'choices': ['full', 'count', False],
+            'help': ('specify whether to embed related events data '
+                     '(ignored for search queries), can specify full '
+                     'embed, or just counts (default=full)'),
+            'default': 'full'
+        }),
+        ('tz', {
+            'type': tz,
+            'help': 'specify timezone as IANA info key for datetime values'
+        }),
+        ('on', {
+            'type': date_format,
+            'help': 'filter events by occurred date'
+        }),
+        ('before', {
+            'type': datetime_format,
+            'help': 'filter events that occurred before datetime'
+        }),
+        ('after', {
+            'type': datetime_format,
+            'help': 'filter events that occurred after datetime'
+        }),
+        ('cursor', {
+            'type': str,
+            'help': 'pagination cursor'
+        })
+    ]
+
+
+def events_export_arguments(config):
+    return [
+        ('feeds', {
+            'type': comma_separated,
+            'help': 'filter events by specific feed(s)'
+        }),
+        ('tz', {
+            'type': tz,
+            'help': 'specify timezone as IANA info key for datetime values'
+        }),
+        ('before', {
+            'type': datetime_format,
+            'help': 'filter events that occurred before datetime'
+        }),
+        ('after', {
+            'type': datetime_format,
+            'help': 'filter events that occurred after datetime'
+        })
+    ]
+
+
+def events_stream_arguments(config):
+    return [
+        ('feeds', {
+            'type': comma_separated,
+            'help': 'filter events by specific feed(s)'
+        })
+    ]
+
+
 @api.resource('/events/<string:event_id>')
 class Events(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser(argument_class=Argument)
-        self.parser.add_argument(
-            'tz',
-            type=tz,
-            help='specify timezone as IANA info key for date values',
-            location='args'
-        )
+    parser = Schema(events_arguments)
 
-        super().__init__()
-
-    @cache.cached(key_prefix=make_cache_key)
+    @conditional
+    @cached
     def get(self, event_id):
-        args = self.parser.parse_args()
+        args = parse_args(self.parser)
 
         es = store.get_events_by_ids([event_id], timezone=args.tz)
 
@@ -92,73 +188,12 @@ class Events(Resource):
 
 @api.resource('/events')
 class EventsList(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser(argument_class=Argument)
-
-        self.parser.add_argument(
-            'limit',
-            type=limit,
-            help='number of events to retrieve',
-            default=current_app.config['PAGE_SIZE_DEFAULT'],
-            location='args'
-        )
-        self.parser.add_argument(
-            'feeds',
-            type=comma_separated,
-            help='filter events by specific feed(s)',
-            location='args'
-        )
-        self.parser.add_argument(
-            'q',
-            type=str,
-            help='filter events by search query',
-            location='args'
-        )
-        self.parser.add_argument(
-            'embed_related',
-            choices=['full', 'count', False],
-            help=('specify whether to embed related events data '
-                  '(ignored for search queries), can specify full '
-                  'embed, or just counts (default=full)'),
-            default='full',
-            location='args'
-        )
-        self.parser.add_argument(
-            'tz',
-            type=tz,
-            help='specify timezone as IANA info key for datetime values',
-            location='args'
-        )
-        self.parser.add_argument(
-            'on',
-            type=date_format,
-            help='filter events by occurred date',
-            location='args'
-        )
-        self.parser.add_argument(
-            'before',
-            type=datetime_format,
-            help='filter events that occurred before datetime',
-            location='args'
-        )
-        self.parser.add_argument(
-            'after',
-            type=datetime_format,
-            help='filter events that occurred after datetime',
-            location='args'
-        )
-        self.parser.add_argument(
-            'cursor',
-            type=str,
-            help='pagination cursor',
-            location='args'
-        )
+    parser = Schema(events_list_arguments)
 
-        super().__init__()
-
-    @cache.cached(key_prefix=make_cache_key)
+    @conditional
+    @cached
     def get(self):
-        args = self.parser.parse_args()
+        args = parse_args(self.parser)
 
         if args.cursor:
             try:
@@ -198,7 +233,39 @@ class EventsList(Resource):
                     message="Invalid timerange: 'after' must be < 'before'"
                 )
 
-        if args.q:  # fetch by search query
+        if args.ids:  # validate IDs
+            conflicting = [
+                name for name in ('q', 'on', 'before', 'after', 'cursor')
+                if args[name]
+            ]
+
+            if conflicting:
+                abort(
+                    400,
+                    message=(
+                        "Invalid arguments: 'ids' cannot be combined with: %s"
+                    ) % (', '.join(conflicting))
+                )
+
+            args.ids = sorted(set(args.ids))
+
+            if len(args.ids) > current_app.config['PAGE_SIZE_MAX']:
+                abort(
+                    400,
+                    message="Invalid value for 'ids': at most %d allowed" % (
+                        current_app.config['PAGE_SIZE_MAX']
+                    )
+                )
+
+        if args.ids:  # fetch by IDs
+            es = store.get_events_by_ids(
+                args.ids,
+                pagesize=len(args.ids),
+                embed_related=embed_related,
+                timezone=args.tz
+            )
+
+        elif args.q:  # fetch by search query
             everything = set(all_feeds)
             requested = set(feeds)
             unsearchable = set(
@@ -226,12 +293,14 @@ class EventsList(Resource):
                 to_mask=to_mask,
                 to_filter=to_filter,
                 pagesize=args.limit,
-                timezone=args.tz
+                timezone=args.tz,
+                sort=args.sort
             )
 
-            # freeze search, so subsequent pages don't change even if new data
-            # is added
-            if es.latest is not None:
+            # freeze searches paged by page number, so subsequent pages don't
+            # change even if new data is added (keyset cursors aren't shifted
+            # by it)
+            if args.sort == SORT_RELEVANCE and es.latest is not None:
                 args.before = es.latest + datetime.timedelta(microseconds=1)
 
         elif args.on:
@@ -252,15 +321,34 @@ class EventsList(Resource):
                 timezone=args.tz
             )
 
-        try:
-            p = es.page(cursor=args.cursor)
-        except InvalidPage:
-            abort(
-                400,
-                message=(
-                    "Invalid value for 'cursor': value range is 0 < page <= %d"
-                ) % (es.num_pages)
-            )
+        if args.ids:
+            accessible = set(feeds)
+
+            # all requested events are returned at once, dropping any from
+            # feeds that aren't accessible (or not requested)
+            found = [e for e in es if e.feed['short_name'] in accessible]
+            next_cursor = None
+        else:
+            try:
+                p = es.page(cursor=args.cursor)
+            except InvalidPage:
+                if args.q and args.sort != SORT_RELEVANCE:
+                    # searches sorted by occurred are paged by keyset cursors,
+                    # not page numbers
+                    message = (
+                        "Invalid value for 'cursor': "
+                        "not a cursor for a search sorted by %s"
+                    ) % (args.sort)
+                else:
+                    message = (
+                        "Invalid value for 'cursor': "
+                        "value range is 0 < page <= %d"
+                    ) % (es.num_pages)
+
+                abort(400, message=message)
+
+            found = p
+            next_cursor = p.next
 
         data = copy.deepcopy(envelope)
         data['meta']['code'] = 200
@@ -273,11 +361,136 @@ class EventsList(Resource):
                 base_uri=current_app.config['STATIC_URL'],
                 related_count_only=related_count_only
             )
-            for e in p
+            for e in found
         ]
 
-        if p.next is not None:
-            querystring = to_query_params(args, p.next)
+        if next_cursor is not None:
+            querystring = to_query_params(args, next_cursor)
             data['pagination']['next'] = url_for(self.endpoint) + querystring
 
         return data
+
+
+@api.resource('/events/export')
+class EventsExport(Resource):
+    parser = Schema(events_export_arguments)
+
+    def get(self):
+        if not is_authorized():
+            abort(401, message="Authorization required for export")
+
+        args = parse_args(self.parser)
+
+        feeds = list(store.get_feeds())
+
+        if args.feeds:
+            invalid_feeds = set(args.feeds) - set(feeds)
+
+            if invalid_feeds:
+                abort(
+                    400,
+                    message="Invalid value(s) for 'feed': %s" % (
+                        ', '.join(invalid_feeds)
+                    )
+                )
+
+            feeds = args.feeds
+
+        if args.after and args.before:  # validate timerange
+            if args.after >= args.before:
+                abort(
+                    400,
+                    message="Invalid timerange: 'after' must be < 'before'"
+                )
+
+        es = store.get_events_by_timerange(
+            after=args.after,
+            before=args.before,
+            feeds=feeds,
+            timezone=args.tz
+        )
+
+        base_uri = current_app.config['STATIC_URL']
+
+        # iterating the event set walks a single server side cursor, so
+        # events are written out as newline delimited JSON as they arrive
+        lines = (
+            json.dumps(e.dict(base_uri=base_uri)) + '\n'
+            for e in es.iter(server_side=True)
+        )
+
+        return Response(
+            stream_with_context(lines),
+            mimetype='application/x-ndjson'
+        )
+
+
+@api.resource('/events/stream')
+class EventsStream(Resource):
+    parser = Schema(events_stream_arguments)
+
+    def get(self):
+        args = parse_args(self.parser)
+
+        all_feeds = store.get_feeds()
+
+        feeds = all_feeds
+
+        if not is_authorized():
+            feeds = [k for k, f in all_feeds.items() if f.is_public]
+
+        if args.feeds:
+            invalid_feeds = set(args.feeds) - set(feeds)
+
+            if invalid_feeds:
+                abort(
+                    400,
+                    message="Invalid value(s) for 'feed': %s" % (
+                        ', '.join(invalid_feeds)
+                    )
+                )
+
+            feeds = args.feeds
+
+        feeds = set(feeds)
+
+        base_uri = current_app.config['STATIC_URL']
+        keepalive = current_app.config.get('STREAM_KEEPALIVE', 15)
+
+        # subscribe before responding so no events added in between are lost
+        subscription = broadcaster.subscribe()
+
+        def stream():
+            # flush headers to the client straight away
+            yield ': connected\n\n'
+
+            # a client falling too far behind is disconnected, and will
+            # reconnect and resume from live events
+            while not subscription.overflowed:
+                try:
+                    events = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+
+                for e in events:
+                    if e.feed['short_name'] not in feeds:
+                        continue
+
+                    yield 'id: %s\nevent: event\ndata: %s\n\n' % (
+                        e.id,
+                        json.dumps(e.dict(base_uri=base_uri))
+                    )
+
+        response = Response(
+            stream(),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+        response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+
+        return response
@@ -2,32 +2,34 @@ import copy
 
 from flask import current_app
 
-from flask_restful import reqparse, abort, Resource
+from flask_restful import abort, Resource
 from flask_restful.inputs import boolean
 
 from eventlog.service.core.store import store
-from eventlog.service.core.api import api, envelope, Argument
+from eventlog.service.core.api import api, envelope, Schema, parse_args
 from eventlog.service.core.auth import is_authorized
-from eventlog.service.core.caching import cache, make_cache_key
+from eventlog.service.core.caching import cached
+from eventlog.service.core.conditional import conditional
+
+
+def feeds_arguments(config):
+    return [
+        ('admin', {
+            'type': boolean,
+            'help': 'response should include admin data (config, etc)',
+            'default': False
+        })
+    ]
 
 
 @api.resource('/feeds/<string:short_name>')
 class Feeds(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser(argument_class=Argument)
-        self.parser.add_argument(
-            'admin',
-            type=boolean,
-            help='response should include admin data (config, etc)',
-            default=False,
-            location='args'
-        )
+    parser = Schema(feeds_arguments)
 
-        super().__init__()
-
-    @cache.cached(key_prefix=make_cache_key)
+    @conditional
+    @cached
     def get(self, short_name):
-        args = self.parser.parse_args()
+        args = parse_args(self.parser)
 
         data = copy.deepcopy(envelope)
 
@@ -52,21 +54,12 @@ class Feeds(Resource):
 
 @api.resource('/feeds')
 class FeedsList(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser(argument_class=Argument)
-        self.parser.add_argument(
-            'admin',
-            type=boolean,
-            help='response should include admin data (config, etc)',
-            default=False,
-            location='args'
-        )
-
-        super().__init__()
+    parser = Schema(feeds_arguments)
 
-    @cache.cached(key_prefix=make_cache_key)
+    @conditional
+    @cached
     def get(self):
-        args = self.parser.parse_args()
+        args = parse_args(self.parser)
 
         data = copy.deepcopy(envelope)
 
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Backfill all event data for a feed, from a load file and/or remote.
+
+Usage: backfill.py [-hj] <feed> [--load=<file>] [--chunk-size=<n>]
+                   [--checkpoint=<file>]
+
+-h, --help              Show this screen.
+-j, --dry-run           Enable dry run mode, i.e. db changes are not saved.
+    --load=<file>       Load events from file before fetching from remote.
+    --chunk-size=<n>    Events written per transaction [default: 1000]
+    --checkpoint=<file> Save progress to file after every chunk, and resume
+                        from it if it exists.
+"""
+
+import sys
+import time
+import logging
+import docopt
+
+from flask import Flask
+
+from eventlog.lib.store import Store
+from eventlog.service.util import init_config
+
+store = Store()
+
+
+def init_logging():
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter(
+        ('[%(asctime)s.%(msecs)03d]: '
+         '%(levelname)10s | %(name)20s | %(message)s'),
+        '%H:%M:%S'
+    ))
+
+    l = logging.getLogger()  # noqa: E741
+    l.addHandler(handler)
+    l.setLevel(logging.INFO)
+
+
+if __name__ == "__main__":
+    init_logging()
+
+    app = Flask(__name__)
+    init_config(app)
+    store.init_app(app)
+
+    args = docopt.docopt(__doc__)
+
+    feeds = store.get_feeds()
+
+    if args['<feed>'] not in feeds:
+        sys.exit("unknown feed: '%s'" % (args['<feed>']))
+
+    start = time.time()
+
+    added = feeds[args['<feed>']].backfill(
+        loadfile=args['--load'],
+        chunksize=int(args['--chunk-size']),
+        checkpoint=args['--checkpoint'],
+        dry=args['--dry-run']
+    )
+
+    end = time.time()
+
+    print('backfilling %d events took %.3fs' % (added, end - start))
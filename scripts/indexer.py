@@ -3,10 +3,12 @@
 """
 (Re-)Index event data.
 
-Usage: indexer.py [-hj]
+Usage: indexer.py [-hjo]
 
 -h, --help          Show this screen.
 -j, --dry-run       Enable dry run mode, i.e. index changes are not committed.
+-o, --optimize      Merge the existing index into a single segment instead of
+                    re-indexing, the index remains searchable meanwhile.
 """
 
 import time
@@ -44,6 +46,15 @@ if __name__ == "__main__":
 
     args = docopt.docopt(__doc__)
 
+    if args['--optimize']:
+        start = time.time()
+
+        store._index.optimize(dry=args['--dry-run'])
+
+        print('optimizing took %.3fs' % (time.time() - start))
+
+        raise SystemExit
+
     # create index directory if necessary
     indexdir = app.config['STORE']['INDEX_DIR']
 
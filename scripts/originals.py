@@ -106,12 +106,14 @@ if __name__ == "__main__":
 
         if len(batch) == BATCH_LEN:
             logging.info('updating batch of %d events', BATCH_LEN)
-            store.update_events(batch, dry=args["--dry-run"])
+            store.update_events(
+                batch, dry=args["--dry-run"], fields=['original']
+            )
             batch = []
 
     if batch:
         logging.info('updating batch of %d events', len(batch))
-        store.update_events(batch, dry=args["--dry-run"])
+        store.update_events(batch, dry=args["--dry-run"], fields=['original'])
 
     end = time.time()
 
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""
+Serve the HTTP/JSON API from a single process using gevent.
+
+Usage: server.py [-h] [--host=<host>] [--port=<port>]
+
+-h, --help          Show this screen.
+    --host=<host>   Address to listen on [default: 0.0.0.0].
+    --port=<port>   Port to listen on [default: 5000].
+"""
+
+# monkey patch away!
+import gevent.monkey
+gevent.monkey.patch_all()  # noqa
+
+# psycopg2 monkey patch!
+import psycogreen.gevent
+psycogreen.gevent.patch_psycopg()  # noqa
+
+import docopt
+
+from gevent.pywsgi import WSGIServer
+
+from eventlog.service.application import app
+
+
+def main():
+    args = docopt.docopt(__doc__)
+
+    server = WSGIServer((args['--host'], int(args['--port'])), app)
+
+    app.logger.info('serving on %s:%d', *server.address)
+
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -62,9 +62,11 @@ setup(
     ],
     scripts=[
         'scripts/archiver.py',
+        'scripts/backfill.py',
         'scripts/cleaner.py',
         'scripts/indexer.py',
         'scripts/originals.py',
+        'scripts/server.py',
         'scripts/thumbnails.py',
         'scripts/updater.py'
     ],
@@ -86,5 +88,8 @@ setup(
         'psycopg2',
         'pytz',
         'xmltodict'
-    ]
+    ],
+    extras_require={
+        'brotli': ['brotli']
+    }
 )
@@ -0,0 +1,76 @@
+"""
+Benchmark grouping a backfill's worth of synthetic scrobbles, three minutes
+apart in listening sessions of 20 tracks, as Feed.group does for grouped
+feeds (e.g. Last.fm).
+
+Usage: python tests/lib/bench_group.py [<num events>]
+"""
+
+import sys
+import time
+import datetime
+
+from eventlog.lib.feeds import Feed
+from eventlog.lib.events import Event
+
+START = datetime.datetime(2010, 1, 1, tzinfo=datetime.timezone.utc)
+
+SESSION_LEN = 20
+
+
+class ScrobbleFeed(Feed):
+    grouped = True
+    grouped_window = 60 * 60
+
+    def init_parse_params(self, **kwargs):  # pragma: no cover
+        pass
+
+    def parse(self, data):  # pragma: no cover
+        pass
+
+    def to_event(self, raw):  # pragma: no cover
+        pass
+
+
+def scrobbles(num):
+    events = []
+
+    for i in range(num):
+        session, track = divmod(i, SESSION_LEN)
+
+        e = Event()
+        e.title = 'track %d' % (i)
+        e.occurred = START + datetime.timedelta(
+            days=session, minutes=3 * track
+        )
+
+        events.append(e)
+
+    # newest first, as fetched
+    events.reverse()
+
+    return events
+
+
+def main(num):
+    feed = ScrobbleFeed({})
+
+    events = scrobbles(num)
+
+    start = time.perf_counter()
+
+    grouped = feed.group(events)
+
+    elapsed = time.perf_counter() - start
+
+    assert len(grouped) == -(-num // SESSION_LEN)
+
+    print('grouped %d events into %d in %.3fs' % (
+        num,
+        len(grouped),
+        elapsed
+    ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,71 @@
+"""
+Benchmark searches sorted by time against an index of synthetic events, one
+every ten minutes, where a common word matches every event (so every hit is
+sorted), as the first page of a newest or oldest first search.
+
+Usage: python tests/lib/bench_search.py [<num events>]
+"""
+
+import sys
+import time
+import random
+import tempfile
+import datetime
+
+from eventlog.lib.events import Event
+from eventlog.lib.store.search import Index
+from eventlog.lib.store.eventset import SORT_NEWEST, SORT_OLDEST
+
+START = datetime.datetime(2010, 1, 1)
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf']
+
+FEEDS = ['twitter', 'lastfm', 'github', 'flickr']
+
+SEARCHES = 5
+
+
+def events(num):
+    rng = random.Random(0)
+
+    for i in range(num):
+        e = Event()
+        e.feed = {'short_name': FEEDS[i % len(FEEDS)]}
+        e.title = 'event %s' % (rng.choice(WORDS))
+        e.text = ' '.join(rng.choice(WORDS) for _ in range(10))
+        e.occurred = START + datetime.timedelta(minutes=10 * i)
+
+        yield e
+
+
+def main(num):
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = Index(index_dir, cache_size=0)
+
+        start = time.perf_counter()
+
+        index.index(list(events(num)))
+
+        print('indexed %d events in %.3fs' % (
+            num,
+            time.perf_counter() - start
+        ))
+
+        for sort in (SORT_NEWEST, SORT_OLDEST):
+            es = index.search('event', None, None, 10, sort=sort)
+
+            start = time.perf_counter()
+
+            for _ in range(SEARCHES):
+                with index._index.searcher() as searcher:
+                    event_ids, _, _ = es._search_by_occurred(searcher, None)
+
+            elapsed = (time.perf_counter() - start) / SEARCHES
+
+            assert len(event_ids) == 10
+
+            print('%s first search: %.3fs' % (sort, elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -11,6 +11,7 @@ import psycogreen.gevent  # noqa: E402
 psycogreen.gevent.patch_psycopg()
 
 import psycopg2  # noqa: E402
+import psycopg2.pool  # noqa: E402
 
 from eventlog.lib.store.pool import Pool  # noqa: E402
 
@@ -105,6 +106,57 @@ class TestPool(unittest.TestCase):
 
         self.assertEqual(mock_pool.getconn.call_count, min_conn + max_conn)
 
+    def test_wait_for_connection(self):
+
+        min_conn = 2
+        max_conn = 4
+
+        p = Pool(min_conn, max_conn, self.database, self.user, self.password)
+
+        e = gevent.event.Event()
+
+        def work():
+            with p.connect() as cur:
+
+                e.wait()
+
+                cur.execute("select 1")
+
+                return cur.fetchall()[0][0]
+
+        # more concurrent users than connections should queue rather than
+        # exhaust the pool
+        g = [gevent.spawn(work) for i in range(max_conn * 5)]
+
+        gevent.sleep(0.1)
+
+        e.set()
+
+        gevent.joinall(g)
+
+        self.assertEqual([x.value for x in g], [1] * len(g))
+
+    def test_wait_for_connection_timeout(self):
+
+        min_conn = 1
+        max_conn = 1
+
+        p = Pool(min_conn, max_conn, self.database, self.user, self.password,
+                 timeout=0.1)
+
+        with p.connect() as cur:
+            with self.assertRaises(psycopg2.pool.PoolError):
+                with p.connect():
+                    pass
+
+            cur.execute("select 1")
+
+        # connection freed up again
+        with p.connect() as cur:
+            cur.execute("select 1")
+
+            self.assertEqual(cur.fetchall()[0][0], 1)
+
 
 if __name__ == '__main__':
     unittest.main()
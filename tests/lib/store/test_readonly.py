@@ -59,6 +59,20 @@ class TestStoreReadOnly(TestStoreWithDBBase):
     def test_exists_return_false(self):
         self.assertFalse(store.exists(Fields.TITLE, 'oijweoiur319831_'))
 
+    def test_exists_many_return_empty(self):
+        self.assertEqual(store.exists_many(Fields.TITLE, []), set())
+        self.assertEqual(
+            store.exists_many(Fields.TITLE, ['oijweoiur319831_']), set()
+        )
+
+    def test_exists_many_invalid_field(self):
+        self.assertRaises(
+            InvalidField,
+            store.exists_many,
+            'noexist',
+            ['blarg']
+        )
+
     def test_exists_invalid_field(self):
         self.assertRaises(
             InvalidField,
@@ -268,6 +282,17 @@ class TestStoreReadOnly(TestStoreWithDBBase):
 
         self.assertEqual(es.count, len(expected))
 
+    def test_get_events_by_ids_server_side(self):
+
+        ids = [e.id for e in self._events][:3]
+
+        es = store.get_events_by_ids(ids)
+
+        self.assertEqual(
+            [e.dict() for e in es.iter(server_side=True)],
+            [e.dict() for e in es]
+        )
+
     def test_get_events_by_ids_single(self):
 
         expected = self._events[15]
@@ -334,6 +359,16 @@ class TestStoreReadOnly(TestStoreWithDBBase):
             self.assertIsNotNone(value)
             self.assertTrue(store.exists(field, value))
 
+    def test_exists_many_return_existing(self):
+        links = [e.link for e in self._events if e.link is not None][:5]
+
+        self.assertTrue(len(links) > 0)
+
+        self.assertEqual(
+            store.exists_many(Fields.LINK, links + ['oijweoiur319831_']),
+            set(links)
+        )
+
     def test_get_events_by_date_local(self):
         d = datetime.datetime(2012, 11, 24, 0, 0, 0, 0)
 
@@ -1,17 +1,25 @@
 import unittest
+import unittest.mock
 import datetime
 import copy
+import os
+import shutil
+import threading
 
 import psycopg2
 import json
 
+import whoosh.sorting
+
 from flask import Flask
 
 from eventlog.lib.store import Store
-from eventlog.lib.store.search import open_index, Index
+from eventlog.lib.store.search import (open_index, Index, ResultCache,
+                                       IndexLocked, ShardedIndex)
 from eventlog.lib.store.pagination import (InvalidPage, ByTimeRangeCursor,
                                            BySearchCursor)
-from eventlog.lib.events import Event, MissingEventIDException
+from eventlog.lib.store.eventset import _BY_OCCURRED
+from eventlog.lib.events import Event, MissingEventIDException, InvalidField
 from eventlog.lib.feeds import MissingFeedIDException
 
 from ..util import db_drop_all_events
@@ -180,6 +188,134 @@ class TestStoreModify(TestStoreWithDBBase):
 
         index_check_documents(self, store, events, should_exist=False)
 
+    def _fake_events(self):
+        distribution = [(json.dumps(feed), 2) for feed in self._feeds]
+
+        event_dicts = events_create_fake(
+            distribution,
+            datetime.datetime(2012, 1, 12, 0, 0, 0, 0),
+            datetime.datetime(2012, 3, 24, 0, 0, 0, 0)
+        )
+
+        return [Event.from_dict(d) for d in event_dicts]
+
+    def test_index_locked_by_other_writer(self):
+        events = self._fake_events()
+
+        index = Index(self._config['INDEX_DIR'], write_timeout=0.2)
+
+        # as if held by another process writing to the same INDEX_DIR
+        other = open_index(self._config['INDEX_DIR']).writer()
+
+        try:
+            self.assertRaises(IndexLocked, index.index, events)
+            self.assertRaises(IndexLocked, index.remove, feed='feed')
+        finally:
+            other.cancel()
+
+        index.index(events)
+
+        index_check_documents(self, store, events)
+
+    def test_index_waits_for_other_writer(self):
+        events = self._fake_events()
+
+        index = Index(self._config['INDEX_DIR'], write_timeout=10)
+
+        other = open_index(self._config['INDEX_DIR']).writer()
+
+        timer = threading.Timer(0.3, other.cancel)
+        timer.start()
+
+        index.index(events)
+
+        timer.join()
+
+        index_check_documents(self, store, events)
+
+    def test_index_writer_released_on_error(self):
+        events = self._fake_events()
+
+        index = Index(self._config['INDEX_DIR'], write_timeout=0.2)
+
+        broken = unittest.mock.Mock()
+        broken.documents = [{'missing': 'field'}]
+
+        self.assertRaises(Exception, index.index, events + [broken])
+
+        # nothing was committed, and the lock is free for the next writer
+        index_check_documents(self, store, events, should_exist=False)
+
+        index.index(events)
+
+        index_check_documents(self, store, events)
+
+    def test_index_merge_policy(self):
+        events = self._fake_events()
+
+        index = Index(
+            self._config['INDEX_DIR'],
+            max_segments=3,
+            merge_factor=4
+        )
+
+        for e in events:
+            index.index([e])
+
+            self.assertLessEqual(len(index._index._segments()), 3)
+
+        index_check_documents(self, store, events)
+
+    def test_index_merge_policy_tiers(self):
+        events = self._fake_events()
+
+        index = Index(
+            self._config['INDEX_DIR'],
+            max_segments=len(events),
+            merge_factor=2
+        )
+
+        index.index(events[:1])
+        index.index(events[1:2])
+
+        self.assertEqual(len(index._index._segments()), 2)
+
+        # the full tier of single document segments is merged on next commit
+        index.index(events[2:4])
+
+        self.assertEqual(len(index._index._segments()), 1)
+
+        index_check_documents(self, store, events[:4])
+
+    def test_index_optimize(self):
+        events = self._fake_events()
+
+        # never merge on commit
+        index = Index(
+            self._config['INDEX_DIR'],
+            max_segments=len(events) + 1,
+            merge_factor=len(events) + 1
+        )
+
+        for e in events:
+            index.index([e])
+
+        index.optimize(dry=True)
+
+        self.assertEqual(len(index._index._segments()), len(events))
+
+        with index._index.searcher() as searcher:
+            count = searcher.doc_count()
+
+            index.optimize()
+
+            # searchers opened before the merge are unaffected
+            self.assertEqual(searcher.doc_count(), count)
+
+        self.assertEqual(len(index._index._segments()), 1)
+
+        index_check_documents(self, store, events)
+
     def test_add_event_bad_object(self):
         self.assertRaises(
             Exception,
@@ -256,6 +392,93 @@ class TestStoreModify(TestStoreWithDBBase):
 
         self.assertEqual(es.count, len(event_dicts))
 
+    def _copy_events(self, dry=False):
+        distribution = [(json.dumps(feed), 3) for feed in self._feeds]
+
+        event_dicts = events_create_fake(
+            distribution,
+            datetime.datetime(2012, 1, 12, 0, 0, 0, 0),
+            datetime.datetime(2012, 3, 24, 0, 0, 0, 0)
+        )
+        event_dicts.reverse()
+
+        # values which need escaping in COPY's text format
+        event_dicts[0]['title'] = 'tab\there'
+        event_dicts[0]['text'] = 'back\\slash\r\nnew line \\N'
+
+        events = [Event.from_dict(d) for d in event_dicts]
+
+        store.copy_events(events, dry=dry)
+
+        return event_dicts, events
+
+    def test_copy_events(self):
+        event_dicts, events = self._copy_events()
+
+        es = store.get_events_by_timerange()
+
+        from_store = list(es)
+
+        events_compare(self, event_dicts, from_store)
+
+        index_check_documents(self, store, from_store)
+
+    def test_copy_events_without_wait_callback(self):
+        # i.e. sent with COPY, rather than inserts as when patched for gevent
+        callback = psycopg2.extensions.get_wait_callback()
+
+        psycopg2.extensions.set_wait_callback(None)
+
+        try:
+            event_dicts, events = self._copy_events()
+        finally:
+            psycopg2.extensions.set_wait_callback(callback)
+
+        es = store.get_events_by_timerange()
+
+        events_compare(self, event_dicts, list(es))
+
+    def test_copy_events_dry(self):
+        event_dicts, events = self._copy_events(dry=True)
+
+        es = store.get_events_by_timerange()
+
+        self.assertEqual(es.count, 0)
+
+        index_check_documents(self, store, events, should_exist=False)
+
+    def test_copy_existing_events(self):
+        event_dicts, events = self._add_events()
+
+        related = Event.from_dict(
+            events_create_single(
+                self._feeds[0],
+                datetime.datetime(2012, 1, 12, 0, 0, 0, 0)
+            )
+        )
+
+        store.add_events([related])
+
+        e = Event.from_dict(
+            events_create_single(
+                self._feeds[0],
+                datetime.datetime(2012, 1, 11, 0, 0, 0, 0)
+            )
+        )
+        e.add_related(related)
+
+        store.copy_events(events[:3] + [e])
+
+        es = store.get_events_by_timerange()
+
+        self.assertEqual(es.count, len(event_dicts) + 1)
+
+        from_store = store.get_events_by_ids([e.id]).page().events[0]
+
+        self.assertEqual(
+            [r.id for r in from_store.related], [related.id]
+        )
+
     def test_update_feeds_with_nonexistent(self):
         feeds = store.get_feeds()
 
@@ -311,6 +534,129 @@ class TestStoreModify(TestStoreWithDBBase):
 
         self.assertNotIn(new_key, new_f.overrides)
 
+    def test_generations_add_events(self):
+        before = store.get_generations()
+
+        self.assertEqual(len(before), len(self._feeds))
+
+        event_dicts, events = self._add_events()
+
+        after = store.get_generations()
+
+        # bumped by the write, and again once it's indexed
+        for short_name, (generation, modified) in after.items():
+            self.assertEqual(generation, before[short_name][0] + 2)
+            self.assertIsNotNone(modified)
+
+    def test_generations_bumped_after_indexing(self):
+        seen = []
+
+        def index(events, dry=False):
+            # as a search made before the index is written would
+            seen.append(store.get_generations())
+
+        with unittest.mock.patch.object(store._index, 'index', index):
+            self._add_events()
+
+        after = store.get_generations()
+
+        for short_name, (generation, modified) in after.items():
+            self.assertGreater(generation, seen[0][short_name][0])
+            self.assertGreater(modified, seen[0][short_name][1])
+
+    def test_listen_events(self):
+        listener = store.listen_events(timeout=0.5)
+
+        # nothing added yet (first iteration starts listening)
+        self.assertEqual(next(listener), [])
+
+        self._add_events(dry=True)
+
+        # rolled back changes aren't notified
+        self.assertEqual(next(listener), [])
+
+        event_dicts, events = self._add_events()
+
+        notified = []
+
+        while len(notified) < len(events):
+            ids = next(listener)
+
+            self.assertTrue(ids)
+
+            notified.extend(ids)
+
+        listener.close()
+
+        self.assertEqual(sorted(notified), sorted(e.id for e in events))
+
+        # existing events aren't notified again
+        listener = store.listen_events(timeout=0.5)
+
+        next(listener)
+
+        store.add_events(events)
+
+        self.assertEqual(next(listener), [])
+
+        listener.close()
+
+    def test_generations_add_events_dry(self):
+        before = store.get_generations()
+
+        self._add_events(dry=True)
+
+        self.assertEqual(store.get_generations(), before)
+
+    def test_generations_update_and_remove_events(self):
+        event_dicts, events = self._add_events()
+
+        short_name = events[0].feed['short_name']
+
+        before = store.get_generations()
+
+        store.update_events(events[:1])
+
+        after = store.get_generations()
+
+        self.assertEqual(after[short_name][0], before[short_name][0] + 2)
+        self.assertGreater(after[short_name][1], before[short_name][1])
+
+        # fields that aren't indexed aren't re-indexed either
+        store.update_events(events[:1], fields=['link'])
+
+        self.assertEqual(
+            store.get_generations()[short_name][0],
+            before[short_name][0] + 3
+        )
+
+        store.remove_events(events=events[:1])
+        store.remove_events(feed=short_name)
+
+        self.assertEqual(
+            store.get_generations()[short_name][0],
+            before[short_name][0] + 7
+        )
+
+        # other feeds are untouched
+        for k, v in store.get_generations().items():
+            if k != short_name:
+                self.assertEqual(v, before[k])
+
+    def test_generations_update_feeds(self):
+        feeds = store.get_feeds()
+
+        f = next(iter(feeds.values()))
+
+        before = store.get_generations()
+
+        store.update_feeds([f])
+
+        self.assertEqual(
+            store.get_generations()[f.short_name][0],
+            before[f.short_name][0] + 1
+        )
+
     def test_update_events_change_title(self):
 
         event_dicts, events = self._add_events()
@@ -357,6 +703,53 @@ class TestStoreModify(TestStoreWithDBBase):
 
         self.assertEqual(es.count, 0)
 
+    def test_update_events_fields(self):
+
+        event_dicts, events = self._add_events()
+
+        thumbnail = {'path': 'thumbs/ab/cd', 'width': 1, 'height': 2}
+
+        for i, d in enumerate(event_dicts):
+            d['title'] = 'changed to %d' % (i)
+            d['thumbnail'] = thumbnail if i % 2 else None
+
+        events = [Event.from_dict(d) for d in event_dicts]
+
+        with unittest.mock.patch.object(store._index, 'index') as index:
+            store.update_events(events, fields=['thumbnail'])
+
+        # title and text are unchanged, so there's nothing to re-index
+        index.assert_not_called()
+
+        from_store = {e.id: e for e in store.get_events_by_timerange()}
+
+        for e in events:
+            self.assertEqual(from_store[e.id].thumbnail, e.thumbnail)
+            self.assertNotEqual(from_store[e.id].title, e.title)
+
+        store.update_events(events, fields=['title'])
+
+        es = store.get_events_by_search("changed")
+
+        self.assertEqual(es.count, len(event_dicts))
+
+    def test_update_events_invalid_field(self):
+        event_dicts, events = self._add_events()
+
+        self.assertRaises(
+            InvalidField,
+            store.update_events,
+            events,
+            fields=['feed_id']
+        )
+
+        self.assertRaises(
+            InvalidField,
+            store.update_events,
+            events,
+            fields=[]
+        )
+
     def test_update_events_with_nonexistent(self):
         e = Event.from_dict(
             events_create_single(
@@ -412,6 +805,100 @@ class TestStoreModify(TestStoreWithDBBase):
 
         index_check_documents(self, store, removed, should_exist=False)
 
+    def test_delete_events_by_feed_with_related(self):
+        event_dicts, events = self._add_events()
+
+        removed = [e for e in events if e.related]
+
+        self.assertTrue(len(removed) > 0)
+
+        to_remove = removed[0].feed['short_name']
+        removed = [e for e in events if e.feed['short_name'] == to_remove]
+
+        store.remove_events(feed=to_remove)
+
+        es = store.get_events_by_timerange(feeds=[to_remove], flattened=True)
+
+        self.assertEqual(es.count, 0)
+
+        es = store.get_events_by_timerange()
+        self.assertEqual(es.count, len(events) - len(removed))
+
+        with store._pool.connect() as cur:
+            cur.execute(
+                """
+                select count(*) from related_events
+                where parent = any(%s::uuid[])
+                """,
+                ([e.id for e in removed], )
+            )
+
+            self.assertEqual(cur.fetchone()[0], 0)
+
+        index_check_documents(self, store, removed, should_exist=False)
+
+    def test_delete_events_with_shared_related(self):
+        related = Event.from_dict(
+            events_create_single(
+                self._feeds[0],
+                datetime.datetime(2012, 1, 12, 0, 0, 0, 0)
+            )
+        )
+
+        parents = []
+
+        for day in [10, 11]:
+            e = Event.from_dict(
+                events_create_single(
+                    self._feeds[0],
+                    datetime.datetime(2012, 1, day, 0, 0, 0, 0)
+                )
+            )
+            e.add_related(related)
+
+            parents.append(e)
+
+        store.add_events(parents)
+
+        # still related to the remaining parent
+        store.remove_events(events=parents[:1])
+
+        es = store.get_events_by_ids([related.id])
+
+        self.assertEqual(es.count, 1)
+
+        es = store.get_events_by_ids([parents[1].id])
+
+        self.assertEqual(
+            [r.id for r in es.page().events[0].related], [related.id]
+        )
+
+        store.remove_events(events=parents[1:])
+
+        es = store.get_events_by_timerange(flattened=True)
+
+        self.assertEqual(es.count, 0)
+
+        index_check_documents(self, store, parents, should_exist=False)
+
+    def test_delete_related_event(self):
+        event_dicts, events = self._add_events()
+
+        parent = next(e for e in events if e.related)
+        child = parent.related[0]
+
+        store.remove_events(events=[child])
+
+        es = store.get_events_by_ids([child.id])
+
+        self.assertEqual(es.count, 0)
+
+        es = store.get_events_by_ids([parent.id])
+
+        self.assertNotIn(
+            child.id, [r.id for r in es.page().events[0].related or []]
+        )
+
     def test_delete_events_by_list_dry(self):
         event_dicts, events = self._add_events()
 
@@ -788,6 +1275,184 @@ class TestStoreModify(TestStoreWithDBBase):
         with self.assertRaises(InvalidPage):
             es.page(BySearchCursor(es.num_pages + 6))
 
+    def _add_searchable_events(self):
+        event_dicts, events = self._add_events()
+
+        for i, d in enumerate(event_dicts):
+            d['title'] = 'changed to %d' % (i)
+
+        events = [Event.from_dict(d) for d in event_dicts]
+
+        # include events sharing the same occurred timestamp
+        tied = []
+
+        for i in range(3):
+            event_dict = events_create_single(
+                self._feeds[0],
+                datetime.datetime(2012, 2, 2, 0, 0, 0, 0)
+            )
+            event_dict['title'] = 'changed tied %d' % (i)
+
+            tied.append(Event.from_dict(event_dict))
+
+        store.update_events(events)
+        store.add_events(tied)
+
+        return events + tied
+
+    def test_search_pages_by_occurred(self):
+        events = self._add_searchable_events()
+
+        expected = sorted(
+            [(e.occurred, e.id) for e in events],
+            reverse=True
+        )
+
+        for tz in [None, 'America/Toronto']:
+            es = store.get_events_by_search("changed", pagesize=4, timezone=tz)
+
+            found = []
+
+            for p in es.pages():
+                self.assertLessEqual(len(p), 4)
+
+                if p.next is not None:
+                    self.assertIsInstance(p.next, ByTimeRangeCursor)
+                    self.assertEqual(p.next.id, list(p)[-1].id)
+
+                found += [e.id for e in p]
+
+            self.assertEqual(found, [i for _, i in expected])
+            self.assertEqual([e.id for e in es], found)
+
+    def test_search_pages_oldest(self):
+        events = self._add_searchable_events()
+
+        expected = sorted([(e.occurred, e.id) for e in events])
+
+        es = store.get_events_by_search("changed", pagesize=4, sort='oldest')
+
+        found = []
+
+        for p in es.pages():
+            found += [e.id for e in p]
+
+        self.assertEqual(found, [i for _, i in expected])
+
+        # counted by a separate search
+        self.assertEqual(es.count, len(events))
+        self.assertEqual(es.latest, expected[-1][0])
+
+    def test_search_pages_split_ties(self):
+        events = self._add_searchable_events()
+
+        expected = sorted([(e.occurred, e.id) for e in events])
+
+        # every page size, so that tied events are split across pages at
+        # every position
+        for pagesize in range(1, 5):
+            for sort, ordered in [('oldest', expected),
+                                  ('newest', expected[::-1])]:
+                es = store.get_events_by_search(
+                    "changed", pagesize=pagesize, sort=sort
+                )
+
+                found = []
+
+                for p in es.pages():
+                    self.assertLessEqual(len(p), pagesize)
+
+                    found += [e.id for e in p]
+
+                self.assertEqual(found, [i for _, i in ordered])
+
+    def test_search_sorted_by_column(self):
+        self._add_searchable_events()
+
+        es = store.get_events_by_search("changed")
+
+        # sorting by postings (e.g. of the id field) reads every value of the
+        # field for each search
+        with es._index.searcher() as searcher:
+            categorizer = _BY_OCCURRED.categorizer(searcher)
+
+        self.assertIsInstance(categorizer, whoosh.sorting.ColumnCategorizer)
+
+    def test_search_metadata(self):
+        events = self._add_searchable_events()
+
+        latest = max(e.occurred for e in events)
+
+        es = store.get_events_by_search("changed", pagesize=4)
+
+        es.page()
+
+        # determined by the first page
+        self.assertEqual(es.count, len(events))
+        self.assertEqual(es.latest, latest)
+
+        es = store.get_events_by_search("nothing matches")
+
+        self.assertEqual(es.count, 0)
+        self.assertIsNone(es.latest)
+
+    def test_search_by_relevance(self):
+        events = self._add_searchable_events()
+
+        es = store.get_events_by_search(
+            "changed", pagesize=4, sort='relevance'
+        )
+
+        found = []
+
+        for p in es.pages():
+            if p.next is not None:
+                self.assertIsInstance(p.next, BySearchCursor)
+
+            found += [e.id for e in p]
+
+        self.assertEqual(len(found), len(events))
+        self.assertEqual(set(found), set(e.id for e in events))
+
+        with self.assertRaises(InvalidPage):
+            es.page(BySearchCursor(es.num_pages + 1))
+
+        with self.assertRaises(InvalidPage):
+            es.page(ByTimeRangeCursor(events[0].occurred, events[0].id))
+
+    def test_search_with_invalid_sort(self):
+        with self.assertRaises(ValueError):
+            store.get_events_by_search("changed", sort='alphabetical')
+
+    def test_search_pages_stable(self):
+        events = self._add_searchable_events()
+
+        es = store.get_events_by_search("changed", pagesize=4)
+
+        found = [e.id for e in es.page()]
+
+        # newer events added while paging don't shift later pages
+        event_dict = events_create_single(
+            self._feeds[0],
+            datetime.datetime(2013, 1, 1, 0, 0, 0, 0)
+        )
+        event_dict['title'] = 'changed newest'
+
+        store.add_events([Event.from_dict(event_dict)])
+
+        p = es.page()
+
+        while True:
+            found += [e.id for e in p]
+
+            if p.next is None:
+                break
+
+            p = es.page()
+
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), set(e.id for e in events))
+
     def test_reopen_existing_index(self):
         self._add_events()
 
@@ -821,6 +1486,234 @@ class TestStoreModify(TestStoreWithDBBase):
 
             self.assertTrue(len(documents) > 0)
 
+    def test_search_result_cache(self):
+        events = self._add_searchable_events()
+
+        index = store._index._index
+
+        def search():
+            es = store.get_events_by_search("changed", pagesize=4)
+
+            found = []
+
+            for p in es.pages():
+                found += [e.id for e in p]
+
+            return found, es.count
+
+        expected = search()
+
+        with unittest.mock.patch.object(
+            index, 'searcher', wraps=index.searcher
+        ) as searcher:
+            # repeated searches don't touch the index
+            self.assertEqual(search(), expected)
+            self.assertEqual(searcher.call_count, 0)
+
+            es = store.get_events_by_search(
+                "changed", pagesize=4, sort='oldest'
+            )
+            es.page()
+
+            self.assertEqual(searcher.call_count, 1)
+
+            # changing the index invalidates cached results
+            event_dict = events_create_single(
+                self._feeds[0],
+                datetime.datetime(2013, 1, 1, 0, 0, 0, 0)
+            )
+            event_dict['title'] = 'changed newest'
+
+            store.add_events([Event.from_dict(event_dict)])
+
+            found, count = search()
+
+        self.assertEqual(found, [event_dict['id']] + expected[0])
+        self.assertEqual(count, len(events) + 1)
+
+    def test_search_result_cache_disabled(self):
+        events = self._add_searchable_events()
+
+        config = copy.deepcopy(self._config)
+        config['INDEX_CACHE_SIZE'] = 0
+
+        test_app = Flask('TestApp')
+        test_app.config['STORE'] = config
+
+        test_store = Store()
+        test_store.init_app(test_app)
+
+        self.assertIsNone(test_store._index._results)
+
+        es = test_store.get_events_by_search("changed")
+
+        self.assertEqual(len(list(es)), len(events))
+        self.assertEqual(es.count, len(events))
+
+    def _sharded_store(self, events):
+        config = copy.deepcopy(self._config)
+        config['INDEX_DIR'] = self._config['INDEX_DIR'] + '-sharded'
+        config['INDEX_SHARDED'] = True
+
+        self.addCleanup(shutil.rmtree, config['INDEX_DIR'], True)
+
+        test_app = Flask('TestApp')
+        test_app.config['STORE'] = config
+
+        test_store = Store()
+        test_store.init_app(test_app)
+
+        # events are already in the db, only index them
+        test_store._index.index(events)
+
+        return test_store
+
+    def test_sharded_index(self):
+        events = self._add_searchable_events()
+
+        test_store = self._sharded_store(events)
+
+        self.assertIsInstance(test_store._index, ShardedIndex)
+
+        feeds = sorted(set(e.feed['short_name'] for e in events))
+
+        self.assertEqual(test_store._index._names(), feeds)
+
+        for sort in ['newest', 'oldest', 'relevance']:
+            es = store.get_events_by_search("changed", pagesize=4, sort=sort)
+            sharded = test_store.get_events_by_search(
+                "changed", pagesize=4, sort=sort
+            )
+
+            self.assertEqual(sharded.count, es.count)
+
+            if sort == 'relevance':
+                # equal scores may be ordered differently
+                self.assertEqual(
+                    set(e.id for e in sharded), set(e.id for e in es)
+                )
+            else:
+                self.assertEqual(
+                    [e.id for e in sharded], [e.id for e in es]
+                )
+
+    def test_sharded_index_search_feeds(self):
+        events = self._add_searchable_events()
+
+        test_store = self._sharded_store(events)
+
+        to_filter = ['testfeed2']
+
+        expected = [e.id for e in events if e.feed['short_name'] in to_filter]
+
+        es = test_store.get_events_by_search("changed", to_filter=to_filter)
+
+        # only the requested feed's shard is searched
+        self.assertEqual(len(es._index._searched), 1)
+
+        self.assertEqual(sorted(e.id for e in es), sorted(expected))
+
+        es = test_store.get_events_by_search(
+            "changed", to_mask=test_store._index._names()
+        )
+
+        self.assertEqual(len(es._index._searched), 0)
+        self.assertEqual(es.count, 0)
+
+    def test_sharded_index_remove(self):
+        events = self._add_searchable_events()
+
+        test_store = self._sharded_store(events)
+
+        removed = events[0].feed['short_name']
+
+        test_store._index.remove(feed=removed)
+
+        expected = [
+            e.id for e in events if e.feed['short_name'] != removed
+        ]
+
+        es = test_store.get_events_by_search("changed")
+
+        self.assertEqual(sorted(e.id for e in es), sorted(expected))
+
+        # removing events from one shard leaves the others
+        remaining = [e for e in events if e.feed['short_name'] != removed]
+
+        test_store._index.remove(events=remaining[:1])
+
+        es = test_store.get_events_by_search("changed")
+
+        self.assertEqual(es.count, len(expected) - 1)
+
+        # clearing empties every shard
+        test_store._index.clear()
+
+        es = test_store.get_events_by_search("changed")
+
+        self.assertEqual(es.count, 0)
+
+        test_store._index.optimize()
+        test_store._index.remove()
+
+        self.assertTrue(os.path.isdir(test_store._config['INDEX_DIR']))
+
+    def test_sharded_index_writer_order(self):
+        events = self._add_searchable_events()
+
+        test_store = self._sharded_store([])
+
+        # feeds first seen in reverse order
+        events.sort(key=lambda e: e.feed['short_name'], reverse=True)
+
+        names = sorted(set(e.feed['short_name'] for e in events))
+
+        self.assertGreater(len(names), 1)
+
+        writer = Index._writer
+        taken = []
+
+        def record(index, *args, **kwargs):
+            taken.append(os.path.basename(index._index_dir))
+
+            return writer(index, *args, **kwargs)
+
+        with unittest.mock.patch.object(
+                Index, '_writer', autospec=True) as mock_writer:
+            mock_writer.side_effect = record
+
+            test_store._index.index(events)
+
+            self.assertEqual(taken, names)
+
+            del taken[:]
+
+            test_store._index.remove(events=events)
+
+            self.assertEqual(taken, names)
+
+    def test_result_cache(self):
+        cache = ResultCache(2)
+
+        cache.set(1, 'a', [1])
+        cache.set(1, 'b', [2])
+
+        self.assertEqual(cache.get(1, 'a'), [1])
+
+        # least recently used is dropped
+        cache.set(1, 'c', [3])
+
+        self.assertIsNone(cache.get(1, 'b'))
+        self.assertEqual(cache.get(1, 'c'), [3])
+
+        # as is everything for an older generation
+        self.assertIsNone(cache.get(2, 'a'))
+
+        cache.set(2, 'a', [4])
+        cache.clear()
+
+        self.assertIsNone(cache.get(2, 'a'))
+
 
 if __name__ == '__main__':
     unittest.main()
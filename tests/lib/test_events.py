@@ -6,12 +6,13 @@ import json
 from eventlog.lib.events import (Event, Fields, DATEFMT,
                                  UnableToRetrieveImageException)
 from eventlog.lib.util import pg_strptime, utc_datetime_to_local
+from eventlog.lib.scraper import save_thumbnail_content
 from eventlog.lib.store.search import _SCHEMA
 
 from .util import feeds_create_fake, events_create_fake, events_compare
 from .util import events_create_single
 
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 from . import feed_generator
 
@@ -78,8 +79,9 @@ class TestEvents(unittest.TestCase):
             e.latest_occurred
         )
 
+    @patch('eventlog.lib.events.fit_image', lambda img, w, h: img)
     @patch('eventlog.lib.events.save_img_to_dir')
-    @patch('eventlog.lib.events.get_thumbnail_from_url')
+    @patch('eventlog.lib.events.get_largest_image')
     def test_add_thumbnail(self, mock_get_thumb, mock_save_thumb):
 
         thumb = {
@@ -140,6 +142,32 @@ class TestEvents(unittest.TestCase):
 
         self.assertIsNone(e.thumbnail)
 
+    @patch('eventlog.lib.events.save_img_to_dir')
+    def test_save_thumbnail_with_pool(self, mock_save_thumb):
+        event_dict = events_create_single(
+            self._feeds[0],
+            datetime.datetime(2012, 1, 12, 0, 0, 0, 0),
+        )
+
+        e = Event.from_dict(event_dict)
+
+        img = Mock()
+        img.content = b'image'
+
+        pool = Mock()
+        pool.submit.return_value.result.return_value = {'path': 'img/a.png'}
+
+        e.save_thumbnail(img, 200, 200, '/path/to/test/', 'img', pool=pool)
+
+        self.assertDictEqual(e.thumbnail, {'path': 'img/a.png'})
+
+        pool.submit.assert_called_with(
+            save_thumbnail_content, b'image', 200, 200, '/path/to/test/',
+            'img', exclude_md5s=None, dry=False
+        )
+
+        self.assertEqual(mock_save_thumb.call_count, 0)
+
     @patch('eventlog.lib.events.image_url_to_file')
     def test_add_original(self, mock_image_url_to_file):
 
@@ -6,14 +6,19 @@ import re
 import copy
 import tempfile
 import shutil
+import threading
 import os.path
 
 import httplib2
 
 from eventlog.lib.feeds import Feed, HTTPRequestFailure
-from eventlog.lib.events import Event, Fields
+from eventlog.ext.feeds.fitbit import Fitbit
+from eventlog.ext.feeds.delicious import Delicious
+from eventlog.ext.feeds.twitter import Twitter
+from eventlog.lib.events import (Event, Fields,
+                                 UnableToRetrieveImageException)
 
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, ANY
 
 LATEST = time.time()
 DELTA = 10*60
@@ -193,19 +198,39 @@ class TestFeeds(unittest.TestCase):
         last_key = "http://localhost/link5"
 
         self._feed.store = Mock()
-
-        def mock_exists(key_name, key_value):
-            if key_value == last_key and key_name == 'link':
-                return True
-            else:
-                return False
-
-        self._feed.store.exists = mock_exists
+        self._feed.store.exists_many.return_value = set()
 
         events = self._feed.fetch(last_key=last_key)
 
         self.assertEqual(len(events), 5)
 
+        # keys from the last known one on aren't checked
+        self._feed.store.exists_many.assert_called_once_with(
+            Fields.LINK,
+            ['http://localhost/link%d' % i for i in range(5)]
+        )
+
+    def test_non_date_key_existing(self):
+
+        self._feed.key_field = Fields.LINK
+
+        existing = set('http://localhost/link%d' % i for i in range(0, 30, 2))
+
+        self._feed.store = Mock()
+        self._feed.store.exists_many.side_effect = (
+            lambda field, values: existing.intersection(values)
+        )
+
+        events = self._feed.fetch(all=True)
+
+        self.assertEqual(len(events), PER_PAGE*PAGES - len(existing))
+
+        for e in events:
+            self.assertNotIn(e.link, existing)
+
+        # a single query per page
+        self.assertEqual(self._feed.store.exists_many.call_count, PAGES)
+
     def test_non_date_key_iter_events_no_args(self):
         # change feed key to non-DATE
         # iter_events should yield only the first page
@@ -229,7 +254,7 @@ class TestFeeds(unittest.TestCase):
 
         events = self._feed.fetch()
 
-        self._feed.group(events)
+        events = self._feed.group(events)
 
         self.assertEqual(len(events), 1)
         self.assertEqual(len(events[0].related), PER_PAGE*PAGES - 1)
@@ -239,7 +264,7 @@ class TestFeeds(unittest.TestCase):
 
         events = self._feed.fetch()
 
-        self._feed.group(events)
+        events = self._feed.group(events)
 
         self.assertEqual(len(events), PER_PAGE*PAGES)
 
@@ -259,12 +284,45 @@ class TestFeeds(unittest.TestCase):
 
         events = self._feed.fetch()
 
-        self._feed.group(events, latest_event=extra)
+        events = self._feed.group(events, latest_event=extra)
 
         self.assertEqual(len(events), 1)
         self.assertEqual(len(events[0].related), PER_PAGE*PAGES)
         self.assertEqual(events[0].title, "title%d" % (extra_id))
 
+    def test_group_events_returns_new_list(self):
+        self._feed.grouped = True
+        self._feed.grouped_window = 60 * 60
+
+        events = self._feed.fetch()
+
+        grouped = self._feed.group(events)
+
+        self.assertEqual(len(grouped), 1)
+        self.assertEqual(len(events), PER_PAGE*PAGES)
+
+    def test_group_events_with_latest_outside_window(self):
+        extra_raw = {
+            'i': 0,
+            't': 'title_extra',
+            'l': 'http://localhost/link_extra',
+            'time': LATEST - (PER_PAGE*PAGES + 24)*DELTA
+        }
+
+        extra = self._feed.to_event(extra_raw)
+
+        self._feed.grouped = True
+        self._feed.grouped_window = 60 * 60
+
+        events = self._feed.fetch()
+
+        events = self._feed.group(events, latest_event=extra)
+
+        # nothing was added to the latest event, so it isn't included
+        self.assertEqual(len(events), 1)
+        self.assertIsNone(extra.related)
+        self.assertEqual(events[0].title, "title%d" % (PER_PAGE*PAGES - 1))
+
     def test_group_events_multiple_groups(self):
         self._feed.grouped = True
         self._feed.grouped_window = 60 * 60
@@ -289,7 +347,7 @@ class TestFeeds(unittest.TestCase):
             extra_delta = datetime.timedelta(days=extra_days)
             e.occurred -= extra_delta
 
-        self._feed.group(events)
+        events = self._feed.group(events)
 
         # should be as many groups as there were unique days
         self.assertEqual(len(events), unique_days)
@@ -365,12 +423,107 @@ class TestFeeds(unittest.TestCase):
             fh.write(second_last_page.decode('utf-8') + '\n')
 
         self._feed_non_date_key.store = Mock()
-        self._feed_non_date_key.store.exists.return_value = False
+        self._feed_non_date_key.store.exists_many.return_value = set()
 
         events = self._feed_non_date_key.load(loadfile=infile)
 
         self.assertEqual(len(events), PER_PAGE*PAGES)
 
+    def _backfilled(self, store):
+        return [
+            e.title for c in store.copy_events.call_args_list for e in c[0][0]
+        ]
+
+    def test_backfill(self):
+        self._feed.store = Mock()
+
+        added = self._feed.backfill(chunksize=30)
+
+        self.assertEqual(added, PER_PAGE*PAGES)
+
+        chunks = [c[0][0] for c in self._feed.store.copy_events.call_args_list]
+
+        self.assertEqual([len(c) for c in chunks], [30]*6 + [20])
+
+    def test_backfill_resume_from_checkpoint(self):
+        infile = os.path.join(self._tmp_dir, 'testbackfill.json')
+        checkpoint = os.path.join(self._tmp_dir, 'testbackfill.checkpoint')
+
+        conn = httplib2.Http()
+
+        resp1, last_page = conn.request('page=' + str(PAGES), 'GET')
+        resp2, second_last_page = conn.request('page=' + str(PAGES - 1), 'GET')
+
+        with open(infile, 'w') as fh:
+            fh.write(last_page.decode('utf-8') + '\n')
+            fh.write(second_last_page.decode('utf-8') + '\n')
+
+        # interrupted while writing the third chunk
+        self._feed.store = Mock()
+        self._feed.store.copy_events.side_effect = [None, None, Exception]
+
+        self.assertRaises(
+            Exception,
+            self._feed.backfill,
+            loadfile=infile,
+            chunksize=50,
+            checkpoint=checkpoint
+        )
+
+        written = self._backfilled(self._feed.store)[:20 + 50]
+
+        with open(checkpoint) as fh:
+            progress = json.load(fh)
+
+        self.assertEqual(progress['loaded'], 2*PER_PAGE)
+        self.assertEqual(progress['fetched'], 50)
+
+        self._feed.store = Mock()
+
+        added = self._feed.backfill(
+            loadfile=infile,
+            chunksize=50,
+            checkpoint=checkpoint
+        )
+
+        self.assertEqual(added, PER_PAGE*PAGES - len(written))
+
+        written += self._backfilled(self._feed.store)
+
+        self.assertEqual(
+            sorted(written),
+            sorted('title%d' % i for i in range(PER_PAGE*PAGES))
+        )
+
+        # a finished backfill has nothing left to write
+        self._feed.store = Mock()
+
+        added = self._feed.backfill(
+            loadfile=infile,
+            chunksize=50,
+            checkpoint=checkpoint
+        )
+
+        self.assertEqual(added, 0)
+
+    def test_backfill_dry(self):
+        checkpoint = os.path.join(self._tmp_dir, 'testbackfilldry.checkpoint')
+
+        self._feed_non_date_key.store = Mock()
+        self._feed_non_date_key.store.exists_many.return_value = set()
+
+        added = self._feed_non_date_key.backfill(
+            checkpoint=checkpoint,
+            dry=True
+        )
+
+        self.assertEqual(added, PER_PAGE*PAGES)
+        self.assertFalse(os.path.exists(checkpoint))
+
+        self._feed_non_date_key.store.copy_events.assert_called_once_with(
+            ANY, dry=True
+        )
+
     def test_load_with_loadfile_and_dumpfile(self):
         # TODO: implement
         pass
@@ -480,6 +633,117 @@ class TestFeeds(unittest.TestCase):
 
         self.assertEqual(added, 0)
 
+    @patch.object(Event, 'add_archive')
+    @patch.object(Event, 'add_original')
+    @patch.object(Event, 'save_thumbnail')
+    @patch.object(Event, 'fetch_thumbnail')
+    def test_embelish_events(self, mock_fetch, mock_save, mock_original,
+                             mock_archive):
+        events = self._feed.fetch()[:10]
+
+        # no suitable image found for every other event
+        mock_fetch.side_effect = [i % 2 or None for i in range(10)]
+
+        self._feed.embelish_events(events, dry=True)
+
+        self.assertEqual(mock_fetch.call_count, 10)
+        self.assertEqual(mock_original.call_count, 10)
+        self.assertEqual(mock_archive.call_count, 10)
+
+        self.assertEqual(mock_save.call_count, 5)
+
+        mock_save.assert_called_with(
+            1, 200, 200, '/notreal/', 'thumb', exclude_md5s=None, dry=True,
+            pool=None
+        )
+        mock_original.assert_called_with('/notreal/', 'orig', dry=True)
+        mock_archive.assert_called_with('/notreal/', 'arch', dry=True)
+
+    @patch('eventlog.lib.feeds.image_process_pool')
+    @patch.object(Event, 'add_archive')
+    @patch.object(Event, 'add_original')
+    @patch.object(Event, 'save_thumbnail')
+    @patch.object(Event, 'fetch_thumbnail', return_value=1)
+    def test_embelish_events_image_processes(self, mock_fetch, mock_save,
+                                             mock_original, mock_archive,
+                                             mock_pool):
+        self._feed.config['image_processes'] = 4
+
+        self._feed.embelish_events(self._feed.fetch()[:2])
+
+        mock_pool.assert_called_with(4)
+
+        self.assertEqual(mock_save.call_count, 2)
+        self.assertIs(
+            mock_save.call_args[1]['pool'], mock_pool.return_value
+        )
+
+    @patch.object(Event, 'add_archive')
+    @patch.object(Event, 'save_thumbnail')
+    @patch.object(Event, 'fetch_thumbnail')
+    def test_embelish_events_bounded(self, mock_fetch, mock_save,
+                                     mock_archive):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+
+        def download(*args, **kwargs):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+
+            time.sleep(0.01)
+
+            with lock:
+                running[0] -= 1
+
+        mock_fetch.side_effect = download
+
+        self._feed.config['fetch_workers'] = 3
+
+        with patch.object(Event, 'add_original', side_effect=download):
+            self._feed.embelish_events(self._feed.fetch()[:20])
+
+        self.assertEqual(most[0], 3)
+
+    @patch.object(Event, 'add_archive')
+    @patch.object(Event, 'add_original')
+    @patch.object(Event, 'save_thumbnail')
+    @patch.object(Event, 'fetch_thumbnail', autospec=True)
+    def test_embelish_events_with_exception_while_fetching(
+            self, mock_fetch, mock_save, mock_original, mock_archive):
+        events = self._feed.fetch()[:2]
+
+        def fetch(event, width, height):
+            if event is events[0]:
+                raise Exception('bad fetch!')
+
+            # still fetching while the others are shut down
+            time.sleep(0.05)
+
+            return 1
+
+        mock_fetch.side_effect = fetch
+
+        self._feed.config['fetch_workers'] = 2
+
+        with self.assertRaises(Exception):
+            self._feed.embelish_events(events)
+
+        for c in mock_save.call_args_list:
+            self.assertIsNone(c[1]['pool'])
+
+    @patch.object(Event, 'add_archive')
+    @patch.object(Event, 'fetch_thumbnail', return_value=None)
+    def test_embelish_events_with_exception(self, mock_fetch, mock_archive):
+        events = self._feed.fetch()[:10]
+
+        with patch.object(Event, 'add_original') as mock_original:
+            mock_original.side_effect = UnableToRetrieveImageException()
+
+            with self.assertRaises(UnableToRetrieveImageException):
+                self._feed.embelish_events(events)
+
     def test_iter_events_with_bad_http_status(self):
         global STATUS
 
@@ -513,5 +777,113 @@ class TestFeeds(unittest.TestCase):
         self.assertEqual(str(self._feed), str(self._feed.dict(admin=True)))
 
 
+class TestFitbit(unittest.TestCase):
+
+    def setUp(self):
+        self._feed = Fitbit({
+            'overrides': {
+                'oauth2_client_id': 'id',
+                'oauth2_client_secret': 'secret',
+                'oauth2_access_token': 'access',
+                'oauth2_refresh_token': 'refresh',
+                'signup_date': '2012-01-12',
+                'device_id': '1234'
+            }
+        })
+
+        self._feed.store = Mock()
+
+    @patch('httplib2.Http')
+    def test_backfill(self, mock_http):
+        # last synced on sign up, so there's nothing to fetch
+        devices = [{'id': '1234', 'lastSyncTime': '2012-01-12T10:00:00.000'}]
+
+        mock_http.return_value.request.return_value = (
+            MockHttpResponse(), json.dumps(devices).encode('utf8')
+        )
+
+        added = self._feed.backfill()
+
+        self.assertEqual(added, 0)
+
+        self.assertEqual(
+            self._feed.last_sync_time,
+            datetime.datetime(2012, 1, 12, 10, tzinfo=datetime.timezone.utc)
+        )
+
+        self.assertIn(
+            '/1/user/-/devices.json',
+            mock_http.return_value.request.call_args[0][0]
+        )
+
+    @patch('httplib2.Http')
+    def test_load(self, mock_http):
+        devices = [{'id': '1234', 'lastSyncTime': '2012-01-12T10:00:00.000'}]
+
+        mock_http.return_value.request.return_value = (
+            MockHttpResponse(), json.dumps(devices).encode('utf8')
+        )
+
+        self.assertEqual(self._feed.load(), [])
+
+        self.assertIsNotNone(self._feed.last_sync_time)
+
+
+class TestLoadfileFeeds(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._tmp_dir)
+
+    def test_delicious_backfill(self):
+        feed = Delicious({'overrides': {'username': 'someone'}})
+        feed.store = Mock()
+
+        infile = os.path.join(self._tmp_dir, 'delicious.html')
+
+        with open(infile, 'w') as fh:
+            fh.write('<DL><p>\n')
+
+            for i in range(3):
+                fh.write(
+                    '<DT><A HREF="http://localhost/link%d" ADD_DATE="%d" '
+                    'PRIVATE="0" TAGS="a,b">title%d</A>\n' % (
+                        i, 1326326400 + i, i
+                    )
+                )
+
+        self.assertEqual(
+            [e.link for e in feed.load(loadfile=infile)],
+            ['http://localhost/link%d' % (i) for i in range(3)]
+        )
+
+        with patch.object(feed, 'iter_new', return_value=iter([])):
+            added = feed.backfill(loadfile=infile, chunksize=2)
+
+        self.assertEqual(added, 3)
+        self.assertEqual(feed.store.copy_events.call_count, 2)
+
+        self.assertRaises(Exception, feed.backfill)
+
+    def test_twitter_backfill(self):
+        feed = Twitter({
+            'overrides': {
+                'oauth1_consumer_key': 'key',
+                'oauth1_consumer_secret': 'secret',
+                'oauth1_user_key': 'key',
+                'oauth1_user_secret': 'secret'
+            }
+        })
+        feed.store = Mock()
+
+        self.assertRaises(Exception, feed.backfill)
+
+        self.assertEqual(feed.store.copy_events.call_count, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -9,7 +9,8 @@ from eventlog.lib.scraper import (fetch_url, get_largest_image, crop_image,
                                   image_url_to_file, save_img_to_dir,
                                   url_to_image, get_images_from_html,
                                   get_images, content_to_image_obj,
-                                  get_thumbnail_from_url)
+                                  get_thumbnail_from_url,
+                                  save_thumbnail_content, image_process_pool)
 
 from unittest.mock import patch, Mock
 
@@ -480,6 +481,64 @@ class TestScraper(unittest.TestCase):
         mock_get_largest_image.assert_called_with(url, width, height)
         mock_crop_image.assert_called_with(image, width, height)
 
+    def test_content_to_image_obj_keeps_content(self):
+        test_image_path = os.path.join(
+            os.path.dirname(__file__),
+            '../data/image1.JPG'
+        )
+
+        with open(test_image_path, 'rb') as fh:
+            content = fh.read()
+
+        res = content_to_image_obj(content, 'http://test.local/image.jpeg')
+
+        self.assertEqual(res.content, content)
+
+    def test_save_thumbnail_content(self):
+        test_image_path = os.path.join(
+            os.path.dirname(__file__),
+            '../data/image1.JPG'
+        )
+
+        with open(test_image_path, 'rb') as fh:
+            content = fh.read()
+
+        res = save_thumbnail_content(content, 200, 100, self.tempdir, SUB_DIR)
+
+        self.assertDictEqual(res['size'], {'width': 200, 'height': 100})
+
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tempdir, res['path']))
+        )
+
+        res = save_thumbnail_content(
+            content, 200, 100, self.tempdir, SUB_DIR, dry=True
+        )
+
+        self.assertIsNone(res)
+
+    def test_image_process_pool(self):
+        test_image_path = os.path.join(
+            os.path.dirname(__file__),
+            '../data/image1.JPG'
+        )
+
+        with open(test_image_path, 'rb') as fh:
+            content = fh.read()
+
+        pool = image_process_pool(1)
+
+        self.assertIs(image_process_pool(2), pool)
+
+        res = pool.submit(
+            save_thumbnail_content, content, 200, 100, self.tempdir, SUB_DIR
+        ).result()
+
+        self.assertDictEqual(
+            res,
+            save_thumbnail_content(content, 200, 100, self.tempdir, SUB_DIR)
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
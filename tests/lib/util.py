@@ -20,6 +20,7 @@ def db_drop_all_data(conn):
 
     try:
         cur = conn.cursor()
+        cur.execute('drop table if exists generations')
         cur.execute('drop table if exists related_events')
         cur.execute('drop table if exists events')
         cur.execute('drop table if exists feeds')
@@ -0,0 +1,75 @@
+"""
+Benchmark request throughput of the API using Flask's test client, along with
+the per-request cost of building request argument parsers that compiled
+schemas avoid.
+
+Usage: EVENTLOG_SETTINGS=tests/service/test.conf \
+           python tests/service/bench_requests.py [<num requests>]
+"""
+
+import sys
+import time
+import unittest.mock
+
+# NOTE: this mocks out Store, so import needs to before app
+import util  # noqa: F401
+
+from eventlog.service.application import app
+
+from eventlog.service.core.store import store
+from eventlog.service.endpoints.events import EventsList
+
+
+def setup_store():
+    feed = unittest.mock.Mock(is_public=True, is_searchable=True)
+
+    page = unittest.mock.Mock(next=None)
+    page.__iter__ = unittest.mock.Mock(side_effect=lambda: iter([]))
+
+    event_set = unittest.mock.Mock(latest=None)
+    event_set.page.return_value = page
+
+    store.configure_mock(**{
+        'get_feeds.return_value': {'foo': feed, 'bar': feed},
+        'get_generations.return_value': {'foo': (1, None), 'bar': (1, None)},
+        'get_events_by_timerange.return_value': event_set
+    })
+
+
+def bench(label, func, num):
+    start = time.perf_counter()
+
+    for _ in range(num):
+        func()
+
+    elapsed = time.perf_counter() - start
+
+    print('%-55s %8.1f us/op %10.0f ops/s' % (
+        label,
+        elapsed / num * 1e6,
+        num / elapsed
+    ))
+
+
+def main(num):
+    setup_store()
+
+    client = app.test_client()
+
+    path = '/events?feeds=foo,bar&limit=20&tz=America/Toronto'
+
+    with app.app_context():
+        # cost previously paid on every request by Resource.__init__
+        bench(
+            'build events parser',
+            lambda: EventsList.parser.compile(app.config),
+            num
+        )
+
+        bench('compiled events parser', lambda: EventsList.parser.parser, num)
+
+    bench('GET ' + path, lambda: client.get(path), num)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
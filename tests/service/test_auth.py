@@ -0,0 +1,110 @@
+import time
+import unittest
+import unittest.mock
+
+# NOTE: this mocks out Store, so import needs to before app
+import util  # noqa: F401
+
+from eventlog.service.application import app
+
+from eventlog.service.core.auth import (generate_auth_token,
+                                        verify_auth_token)
+
+import eventlog.service.core.auth
+
+
+class TestAuth(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['SECRET_KEY'] = 'abcd'
+        app.config['AUTH_TOKEN_EXPIRY'] = 600
+
+    def setUp(self):
+        eventlog.service.core.auth._VERIFIED.clear()
+
+        self.addCleanup(app.config.pop, 'AUTH_TOKEN_CACHE_SIZE', None)
+
+    def spy_loads(self):
+        serializer = eventlog.service.core.auth._serializer('abcd')
+
+        patcher = unittest.mock.patch.object(
+            serializer,
+            'loads',
+            wraps=serializer.loads
+        )
+
+        self.addCleanup(patcher.stop)
+
+        return patcher.start()
+
+    def test_verify_cached(self):
+        with app.app_context():
+            token = generate_auth_token()
+
+            loads = self.spy_loads()
+
+            for i in range(3):
+                self.assertTrue(verify_auth_token(token))
+
+        # signature only checked once
+        self.assertEqual(loads.call_count, 1)
+
+    def test_verify_invalid_not_cached(self):
+        with app.app_context():
+            loads = self.spy_loads()
+
+            for i in range(2):
+                self.assertFalse(verify_auth_token('1234'))
+
+        self.assertEqual(loads.call_count, 2)
+        self.assertFalse(eventlog.service.core.auth._VERIFIED)
+
+    def test_verify_cached_expiry(self):
+        with app.app_context():
+            token = generate_auth_token()
+
+            self.assertTrue(verify_auth_token(token))
+
+            with unittest.mock.patch(
+                'eventlog.service.core.auth.time.time',
+                return_value=time.time() + 601
+            ):
+                self.assertFalse(verify_auth_token(token))
+
+        # expired tokens are dropped
+        self.assertFalse(eventlog.service.core.auth._VERIFIED)
+
+    def test_verify_cached_per_secret(self):
+        with app.app_context():
+            token = generate_auth_token()
+
+            self.assertTrue(verify_auth_token(token))
+
+            app.config['SECRET_KEY'] = 'efgh'
+
+            try:
+                self.assertFalse(verify_auth_token(token))
+            finally:
+                app.config['SECRET_KEY'] = 'abcd'
+
+    def test_verify_cache_bounded(self):
+        app.config['AUTH_TOKEN_CACHE_SIZE'] = 2
+
+        with app.app_context():
+            tokens = [generate_auth_token() for i in range(3)]
+
+            for token in tokens:
+                self.assertTrue(verify_auth_token(token))
+
+            # least recently used first
+            self.assertTrue(verify_auth_token(tokens[1]))
+
+            self.assertEqual(
+                list(eventlog.service.core.auth._VERIFIED),
+                [('abcd', tokens[2]), ('abcd', tokens[1])]
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
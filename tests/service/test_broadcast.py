@@ -0,0 +1,116 @@
+import unittest
+import unittest.mock
+import threading
+
+# NOTE: this mocks out Store, so import needs to be before app
+import util  # noqa: F401
+
+from eventlog.service.core.broadcast import Broadcaster, Subscription
+
+
+class TestBroadcast(unittest.TestCase):
+
+    def setUp(self):
+        self._ready = threading.Event()
+        self._proceed = threading.Event()
+        self._closed = threading.Event()
+
+        self._store = unittest.mock.Mock()
+        self._store.get_events_by_ids.side_effect = (
+            lambda ids, pagesize: ['event %s' % (i) for i in ids]
+        )
+
+    def listen_events(self, timeout):
+        try:
+            self._ready.wait(1)
+
+            yield ['a', 'b']
+
+            while True:
+                self._proceed.wait(1)
+
+                yield []
+        finally:
+            self._closed.set()
+
+    def test_subscription_overflow(self):
+        subscription = Subscription(maxsize=1)
+
+        subscription.put(['a'])
+
+        self.assertFalse(subscription.overflowed)
+
+        subscription.put(['b'])
+
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(subscription.get(timeout=0), ['a'])
+
+    def test_broadcast(self):
+        self._store.listen_events.side_effect = self.listen_events
+
+        broadcaster = Broadcaster(self._store)
+
+        first = broadcaster.subscribe()
+        second = broadcaster.subscribe()
+
+        self._ready.set()
+
+        thread = broadcaster._thread
+
+        expected = ['event a', 'event b']
+
+        self.assertEqual(first.get(timeout=1), expected)
+        self.assertEqual(second.get(timeout=1), expected)
+
+        # events are looked up once for all subscribers, with a single
+        # listener
+        self._store.listen_events.assert_called_once_with(timeout=5)
+        self._store.get_events_by_ids.assert_called_once_with(
+            ['a', 'b'],
+            pagesize=2
+        )
+
+        broadcaster.unsubscribe(first)
+        broadcaster.unsubscribe(second)
+
+        self._proceed.set()
+
+        # listener stops once there are no subscribers
+        self.assertTrue(self._closed.wait(1))
+
+        thread.join(1)
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(broadcaster._thread)
+
+    def test_broadcast_retries(self):
+        self._store.listen_events.side_effect = [
+            Exception('connection failed'),
+            self.listen_events(timeout=5)
+        ]
+
+        broadcaster = Broadcaster(self._store)
+
+        self._ready.set()
+
+        with unittest.mock.patch(
+            'eventlog.service.core.broadcast._RETRY_INTERVAL', 0
+        ):
+            subscription = broadcaster.subscribe()
+
+            self.assertEqual(
+                subscription.get(timeout=1),
+                ['event a', 'event b']
+            )
+
+        broadcaster.unsubscribe(subscription)
+
+        self._proceed.set()
+
+        self.assertTrue(self._closed.wait(1))
+
+        self.assertEqual(self._store.listen_events.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
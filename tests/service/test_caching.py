@@ -0,0 +1,518 @@
+import gzip
+import json
+import time
+import threading
+import unittest
+import unittest.mock
+
+from flask_caching import Cache
+
+from flask_restful.representations.json import output_json
+
+# NOTE: this mocks out Store, so import needs to before app
+import util  # noqa: F401
+
+from eventlog.service.application import app
+
+from eventlog.service.core.store import store
+from eventlog.service.core.caching import make_cache_key, cached
+
+import eventlog.service.core.caching
+from eventlog.service.core.auth import is_authorized
+from eventlog.service.core.compression import encode, ENCODERS
+from eventlog.service.core.conditional import conditional
+from eventlog.service.endpoints.events import EventsList
+
+
+class TestCaching(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['SECRET_KEY'] = 'abcd'
+        app.config['AUTH_TOKEN_EXPIRY'] = 600
+        app.config['PAGE_SIZE_DEFAULT'] = 10
+        app.config['PAGE_SIZE_MAX'] = 100
+
+    def setUp(self):
+        attrs = {
+            'get_generations.return_value': {
+                'foo': (1, None),
+                'bar': (1, None)
+            }
+        }
+
+        store.configure_mock(**attrs)
+
+        store.reset_mock()
+
+    def cache_key(self, path, **kwargs):
+        with app.test_request_context(path, **kwargs):
+            return make_cache_key(EventsList())
+
+    def test_key_changes_with_generation(self):
+        key = self.cache_key('/events')
+
+        self.assertEqual(key, self.cache_key('/events'))
+
+        store.get_generations.return_value['bar'] = (2, None)
+
+        self.assertNotEqual(key, self.cache_key('/events'))
+
+    def test_key_ignores_unrequested_feeds(self):
+        key = self.cache_key('/events?feeds=foo')
+
+        store.get_generations.return_value['bar'] = (2, None)
+
+        self.assertEqual(key, self.cache_key('/events?feeds=foo'))
+
+        store.get_generations.return_value['foo'] = (2, None)
+
+        self.assertNotEqual(key, self.cache_key('/events?feeds=foo'))
+
+    def test_key_argument_order(self):
+        self.assertEqual(
+            self.cache_key('/events?feeds=foo,bar&limit=10'),
+            self.cache_key('/events?limit=10&feeds=bar,foo')
+        )
+
+    def test_key_defaults_applied(self):
+        self.assertEqual(
+            self.cache_key('/events'),
+            self.cache_key('/events?limit=10&embed_related=full')
+        )
+
+        self.assertNotEqual(
+            self.cache_key('/events'),
+            self.cache_key('/events?limit=20')
+        )
+
+    def test_key_escaped(self):
+        self.assertNotEqual(
+            self.cache_key('/events?q=x%26sort%3Dnewest'),
+            self.cache_key('/events?q=x&sort=newest')
+        )
+
+    def test_key_default_sort(self):
+        self.assertEqual(
+            self.cache_key('/events?q=x'),
+            self.cache_key('/events?q=x&sort=newest')
+        )
+
+    def test_key_timezone_normalized(self):
+        self.assertEqual(
+            self.cache_key('/events?tz=america/toronto'),
+            self.cache_key('/events?tz=America/Toronto')
+        )
+
+    def test_key_with_invalid_arguments(self):
+        self.assertNotEqual(
+            self.cache_key('/events?limit=9999'),
+            self.cache_key('/events?limit=999')
+        )
+
+    def test_key_authorized(self):
+        with unittest.mock.patch(
+            'eventlog.service.core.auth.verify_auth_token',
+            return_value=True
+        ) as verify:
+            with app.test_request_context(
+                '/events',
+                headers={'Authorization': 'Bearer 1234'}
+            ):
+                key = make_cache_key(EventsList())
+
+                self.assertTrue(is_authorized())
+
+            # token is only verified once per request
+            self.assertEqual(verify.call_count, 1)
+
+        self.assertTrue(key.startswith('/events?'))
+        self.assertIn('authenticated', key)
+
+    def test_generations_fetched_once_per_request(self):
+        with app.test_request_context('/events'):
+            make_cache_key()
+            make_cache_key()
+
+        self.assertEqual(store.get_generations.call_count, 1)
+
+
+class TestCached(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._cache = Cache()
+        cls._cache.init_app(app, config={'CACHE_TYPE': 'SimpleCache'})
+
+    def setUp(self):
+        attrs = {'get_generations.return_value': {'foo': (1, None)}}
+
+        store.configure_mock(**attrs)
+
+        self._cache.clear()
+
+        patcher = unittest.mock.patch.object(
+            eventlog.service.core.caching, 'cache', self._cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = unittest.mock.patch.dict(app.config, {
+            'CACHE_DEFAULT_TIMEOUT': 300,
+            'CACHE_STALE_WHILE_REVALIDATE': 0,
+            'CACHE_LOCK_TIMEOUT': 5
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._calls = 0
+        self._release = threading.Event()
+        self._release.set()
+
+    def compute(self, resource):
+        self._calls += 1
+
+        self._release.wait(5)
+
+        return {'calls': self._calls}
+
+    def call(self, f, results=None, headers=None):
+        with app.test_request_context('/events', headers=headers):
+            value = f(None).get_json()
+
+        if results is not None:
+            results.append(value)
+
+        return value
+
+    def entry(self, value, fresh_until):
+        with app.app_context():
+            return (encode(value), fresh_until)
+
+    def cache_key(self):
+        with app.test_request_context('/events'):
+            return make_cache_key()
+
+    def wait_for_calls(self, num):
+        deadline = time.time() + 5
+
+        while self._calls < num and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_cached(self):
+        f = cached(self.compute)
+
+        self.assertEqual(self.call(f), {'calls': 1})
+        self.assertEqual(self.call(f), {'calls': 1})
+
+        self.assertEqual(self._calls, 1)
+
+    def test_single_flight(self):
+        f = cached(self.compute)
+
+        self._release.clear()
+
+        results = []
+
+        threads = [
+            threading.Thread(target=self.call, args=(f, results))
+            for i in range(5)
+        ]
+
+        for t in threads:
+            t.start()
+
+        self.wait_for_calls(1)
+
+        # give the other requests a chance to join the flight
+        time.sleep(0.1)
+
+        self._release.set()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self._calls, 1)
+        self.assertEqual(results, [{'calls': 1}] * 5)
+
+    def test_single_flight_error(self):
+
+        def compute(resource):
+            self._calls += 1
+
+            raise ValueError('uh oh!')
+
+        f = cached(compute)
+
+        self.assertRaises(ValueError, self.call, f)
+        self.assertRaises(ValueError, self.call, f)
+
+        # failures are not cached
+        self.assertEqual(self._calls, 2)
+
+    def test_single_flight_error_shared(self):
+
+        def compute(resource):
+            self._calls += 1
+
+            self._release.wait(5)
+
+            raise ValueError('uh oh!')
+
+        f = cached(compute)
+
+        self._release.clear()
+
+        errors = []
+
+        def call():
+            try:
+                self.call(f)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(3)]
+
+        for t in threads:
+            t.start()
+
+        self.wait_for_calls(1)
+
+        time.sleep(0.1)
+
+        self._release.set()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self._calls, 1)
+        self.assertEqual(len(errors), 3)
+
+    def test_single_flight_wait_timeout(self):
+        app.config['CACHE_LOCK_TIMEOUT'] = 0.1
+
+        def compute(resource):
+            self._calls += 1
+
+            # only the first computation is slow
+            if self._calls == 1:
+                self._release.wait(5)
+
+            return {'calls': self._calls}
+
+        f = cached(compute)
+
+        self._release.clear()
+
+        leader = threading.Thread(target=self.call, args=(f,))
+        leader.start()
+
+        self.wait_for_calls(1)
+
+        # gives up waiting on the leader
+        self.assertEqual(self.call(f), {'calls': 2})
+
+        self._release.set()
+
+        leader.join()
+
+    def test_cache_backend_errors(self):
+        f = cached(self.compute)
+
+        with unittest.mock.patch.object(
+            self._cache, 'get', side_effect=Exception
+        ), unittest.mock.patch.object(
+            self._cache, 'set', side_effect=Exception
+        ):
+            self.assertEqual(self.call(f), {'calls': 1})
+            self.assertEqual(self.call(f), {'calls': 2})
+
+    def test_wait_for_other_process(self):
+        f = cached(self.compute)
+
+        key = self.cache_key()
+
+        # simulate another process computing the entry
+        self._cache.add(key + ':lock', True)
+
+        timer = threading.Timer(
+            0.1,
+            self._cache.set,
+            args=(key, self.entry({'calls': 'other'}, None))
+        )
+        timer.start()
+
+        self.assertEqual(self.call(f), {'calls': 'other'})
+        self.assertEqual(self._calls, 0)
+
+        timer.join()
+
+    def test_wait_for_other_process_timeout(self):
+        app.config['CACHE_LOCK_TIMEOUT'] = 0.1
+
+        f = cached(self.compute)
+
+        self._cache.add(self.cache_key() + ':lock', True)
+
+        self.assertEqual(self.call(f), {'calls': 1})
+
+        # the other process still holds its lock
+        self.assertTrue(self._cache.get(self.cache_key() + ':lock'))
+
+    def test_stale_while_revalidate(self):
+        app.config['CACHE_STALE_WHILE_REVALIDATE'] = 60
+
+        f = cached(self.compute)
+
+        key = self.cache_key()
+
+        self._cache.set(key, self.entry({'calls': 'stale'}, time.time() - 1))
+
+        self._release.clear()
+
+        results = []
+
+        refresh = threading.Thread(target=self.call, args=(f, results))
+        refresh.start()
+
+        self.wait_for_calls(1)
+
+        # served stale while the entry is being refreshed
+        self.assertEqual(self.call(f), {'calls': 'stale'})
+
+        self._release.set()
+        refresh.join()
+
+        self.assertEqual(results, [{'calls': 1}])
+        self.assertEqual(self.call(f), {'calls': 1})
+        self.assertEqual(self._calls, 1)
+
+    def test_stale_while_revalidate_other_process(self):
+        app.config['CACHE_STALE_WHILE_REVALIDATE'] = 60
+
+        f = cached(self.compute)
+
+        key = self.cache_key()
+
+        self._cache.set(key, self.entry({'calls': 'stale'}, time.time() - 1))
+        self._cache.add(key + ':lock', True)
+
+        self.assertEqual(self.call(f), {'calls': 'stale'})
+        self.assertEqual(self._calls, 0)
+
+    def test_cached_compressed(self):
+        f = cached(self.compute)
+
+        with unittest.mock.patch(
+            'eventlog.service.core.compression.output_json',
+            wraps=output_json
+        ) as serialize:
+            for encoding in ['gzip', 'identity', 'gzip;q=0, identity']:
+                with app.test_request_context(
+                    '/events',
+                    headers={'Accept-Encoding': encoding}
+                ):
+                    response = f(None)
+
+                    self.assertIn('Accept-Encoding', response.vary)
+
+                    if encoding == 'gzip':
+                        self.assertEqual(response.content_encoding, 'gzip')
+
+                        body = gzip.decompress(response.get_data())
+                    else:
+                        self.assertIsNone(response.content_encoding)
+
+                        body = response.get_data()
+
+                    self.assertEqual(json.loads(body), {'calls': 1})
+
+        # hits are served from the cached bytes
+        self.assertEqual(serialize.call_count, 1)
+
+    def test_cached_encoding_unavailable(self):
+        f = cached(self.compute)
+
+        key = self.cache_key()
+
+        value, fresh_until = self.entry({'calls': 'old'}, None)
+
+        del value['gzip']
+
+        self._cache.set(key, (value, fresh_until))
+
+        with app.test_request_context(
+            '/events',
+            headers={'Accept-Encoding': 'gzip'}
+        ):
+            response = f(None)
+
+            self.assertIsNone(response.content_encoding)
+            self.assertEqual(response.get_json(), {'calls': 'old'})
+
+    def test_uncached_compressed_once(self):
+        null_cache = Cache()
+        null_cache.init_app(app, config={
+            'CACHE_TYPE': 'NullCache',
+            'CACHE_NO_NULL_WARNING': True
+        })
+
+        compress = unittest.mock.Mock(wraps=ENCODERS['gzip'])
+
+        f = cached(self.compute)
+
+        with unittest.mock.patch.object(
+            eventlog.service.core.caching, 'cache', null_cache
+        ), unittest.mock.patch.dict(ENCODERS, {'gzip': compress}):
+            for encoding in ['gzip', 'identity']:
+                with app.test_request_context(
+                    '/events',
+                    headers={'Accept-Encoding': encoding}
+                ):
+                    f(None)
+
+        # nothing is stored, so only the negotiated coding is compressed
+        self.assertEqual(self._calls, 2)
+        self.assertEqual(compress.call_count, 1)
+
+    def test_conditional_weak_etag(self):
+        f = conditional(cached(self.compute))
+
+        with app.test_request_context('/events'):
+            etag = f(None).headers['ETag']
+
+        self.assertFalse(etag.startswith('W/'))
+
+        with app.test_request_context(
+            '/events',
+            headers={'Accept-Encoding': 'gzip'}
+        ):
+            response = f(None)
+
+            self.assertEqual(response.headers['ETag'], 'W/' + etag)
+            self.assertEqual(response.content_encoding, 'gzip')
+
+        # either form of the ETag validates
+        with app.test_request_context(
+            '/events',
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+        ):
+            response = f(None)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'], 'W/' + etag)
+            self.assertIn('Accept-Encoding', response.vary)
+
+    def test_conditional_uncached(self):
+        f = conditional(self.compute)
+
+        with app.test_request_context('/events'):
+            data, code, headers = f(None)
+
+        self.assertEqual(data, {'calls': 1})
+        self.assertEqual(code, 200)
+        self.assertIn('ETag', headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
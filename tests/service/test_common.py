@@ -2,6 +2,8 @@ import unittest
 import unittest.mock
 import os
 import json
+import time
+import difflib
 
 # NOTE: this mocks out Store, so import needs to before app
 import util
@@ -11,6 +13,10 @@ from eventlog.service.application import app
 from eventlog.service.core.store import store
 
 from eventlog.service.util import DEFAULT_CONFIG_FILE, init_config
+from eventlog.service.core.api import api, RouteSuggestions
+from eventlog.service.endpoints.events import EventsList
+
+from flask import Flask
 
 
 class TestCommon(unittest.TestCase):
@@ -24,7 +30,10 @@ class TestCommon(unittest.TestCase):
         cls._feed = unittest.mock.Mock(**feed_attrs)
 
         # setup mock Store
-        attrs = {'get_feeds.return_value': {'foo': cls._feed}}
+        attrs = {
+            'get_feeds.return_value': {'foo': cls._feed},
+            'get_generations.return_value': {'foo': (1, None)}
+        }
 
         store.configure_mock(**attrs)
 
@@ -98,6 +107,83 @@ class TestCommon(unittest.TestCase):
         self.assertIn("error_type", resp_data['meta'])
         self.assertIn("error_message", resp_data['meta'])
 
+    def test_not_found_suggestions_memoized(self):
+        with unittest.mock.patch(
+            'eventlog.service.core.api.difflib.get_close_matches',
+            wraps=difflib.get_close_matches
+        ) as get_close_matches:
+            for i in range(2):
+                rv = self.app.get('/feedz')
+
+                self.assertEqual(rv.status_code, 404)
+                self.assertIn(
+                    'did you mean /feeds or /feeds/<string:short_name> ?',
+                    rv.get_json()['meta']['error_message']
+                )
+
+        self.assertEqual(get_close_matches.call_count, 1)
+
+        # built once per app
+        with app.app_context():
+            self.assertIs(api.suggestions(), api.suggestions())
+
+    def test_not_found_help_disabled(self):
+        app.config['ERROR_404_HELP'] = False
+
+        try:
+            rv = self.app.get('/fee')
+        finally:
+            del app.config['ERROR_404_HELP']
+
+        self.assertEqual(rv.status_code, 404)
+        self.assertNotIn(
+            'did you mean',
+            rv.get_json()['meta']['error_message']
+        )
+
+    def test_route_suggestions(self):
+        suggestions = RouteSuggestions(app.url_map, size=1, rate=1)
+
+        self.assertEqual(suggestions.get('/token'), ['/token'])
+
+        # rate limited, but memoized paths are still suggested
+        self.assertEqual(suggestions.get('/tokens'), [])
+        self.assertEqual(suggestions.get('/token'), ['/token'])
+
+        with unittest.mock.patch(
+            'eventlog.service.core.api.time.monotonic',
+            return_value=time.monotonic() + 1
+        ):
+            self.assertEqual(suggestions.get('/tokens'), ['/token'])
+
+        # only the most recent path is kept
+        self.assertEqual(list(suggestions._memo), ['/tokens'])
+
+        # overly long paths are ignored
+        self.assertEqual(suggestions.get('/token' * 100), [])
+
+        # not rate limited by default
+        unlimited = RouteSuggestions(app.url_map)
+
+        for path in ['/tokens', '/tokenz', '/tokenx']:
+            self.assertEqual(unlimited.get(path), ['/token'])
+
+    def test_schema_compiled_once_per_app(self):
+        with app.app_context():
+            parser = EventsList.parser.parser
+
+            self.assertIs(parser, EventsList.parser.parser)
+
+        other = Flask('other')
+        other.config.update(PAGE_SIZE_DEFAULT=5, PAGE_SIZE_MAX=50)
+
+        with other.test_request_context('/events'):
+            self.assertIsNot(parser, EventsList.parser.parser)
+
+            args = EventsList.parser.parse_args()
+
+            self.assertEqual(args.limit, 5)
+
     def test_propagated_exception(self):
 
         def side_effect(*args, **kwargs):
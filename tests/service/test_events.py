@@ -3,6 +3,7 @@ import unittest.mock
 import json
 import datetime
 import uuid
+import queue
 import urllib.parse
 
 # NOTE: this mocks out Store, so import needs to be before app
@@ -65,6 +66,10 @@ class TestEvents(unittest.TestCase):
 
         self._event_set = unittest.mock.Mock(**event_set_attrs)
 
+        self._modified = datetime.datetime(
+            2014, 1, 1, 12, 1, 1, tzinfo=datetime.timezone.utc
+        )
+
         # setup mock Store
         attrs = {
             'get_feeds.return_value': {
@@ -73,6 +78,11 @@ class TestEvents(unittest.TestCase):
                 'jazz': self._jazz_feed
             },
             'get_feeds.side_effect': None,
+            'get_generations.return_value': {
+                'foo': (3, self._modified),
+                'bar': (2, self._modified - datetime.timedelta(days=1)),
+                'jazz': (1, None)
+            },
             'get_events_by_timerange.return_value': self._event_set,
             'get_events_by_date.return_value': self._event_set,
             'get_events_by_ids.return_value': self._event_set,
@@ -92,6 +102,11 @@ class TestEvents(unittest.TestCase):
         app.debug = False
         self.app = app.test_client()
 
+    def prepare_auth_header(self):
+        resp = self.app.get('/token')
+
+        return {'Authorization': 'Bearer ' + resp.get_json()['data']['token']}
+
     def verify_response(self, resp, code=200, pagination=None, data=None):
         util.verify_headers(resp)
 
@@ -187,22 +202,19 @@ class TestEvents(unittest.TestCase):
         self._event_set.page.assert_called_with(cursor=None)
 
     def test_get_all_with_search_and_next(self):
-        page = 2
         query = "test"
 
-        latest = datetime.datetime.utcnow()
-
-        self._page.next = BySearchCursor(page)
-
-        self._event_set.latest = latest
-
-        before = latest + datetime.timedelta(microseconds=1)
+        self._page.next = ByTimeRangeCursor(
+            datetime.datetime.utcnow(),
+            str(uuid.uuid4())
+        )
 
+        # keyset cursors are stable, so the search isn't frozen with before
         expected_next = (
-            "/events?limit=10&embed_related=full&cursor=%s&before=%s&q=%s" % (
+            "/events?limit=10&embed_related=full&cursor=%s&q=%s&sort=%s" % (
                 eventlog.service.core.cursor.serialize(self._page.next),
-                before.strftime(DATETIME_FMT),
-                query
+                query,
+                'newest'
             )
         )
 
@@ -220,7 +232,8 @@ class TestEvents(unittest.TestCase):
             after=None,
             to_filter=[],
             pagesize=10,
-            timezone=None
+            timezone=None,
+            sort='newest'
         )
 
         self._event_set.page.assert_called_with(cursor=None)
@@ -329,17 +342,107 @@ class TestEvents(unittest.TestCase):
 
         self._event_set.page.assert_called_with(cursor=None)
 
+    def test_get_all_with_search_by_relevance(self):
+        self._page.next = BySearchCursor(2)
+
+        expected_next = (
+            "/events?limit=10&embed_related=full&cursor=2&q=test"
+            "&sort=relevance"
+        )
+
+        rv = self.app.get('/events?q=test&sort=relevance')
+
+        self.verify_response(rv, pagination={"next": expected_next})
+
+        store.get_events_by_search.assert_called_with(
+            'test',
+            to_mask=None,
+            before=None,
+            after=None,
+            to_filter=[],
+            pagesize=10,
+            timezone=None,
+            sort='relevance'
+        )
+
+    def test_get_all_with_search_by_relevance_and_next(self):
+        latest = datetime.datetime.utcnow()
+
+        self._page.next = BySearchCursor(2)
+
+        self._event_set.latest = latest
+
+        before = latest + datetime.timedelta(microseconds=1)
+
+        expected_next = (
+            "/events?limit=10&embed_related=full&cursor=2&before=%s&q=test"
+            "&sort=relevance" % (before.strftime(DATETIME_FMT))
+        )
+
+        rv = self.app.get('/events?q=test&sort=relevance')
+
+        self.verify_response(rv, pagination={"next": expected_next})
+
+        store.get_events_by_search.assert_called_with(
+            'test',
+            to_mask=None,
+            before=None,
+            after=None,
+            to_filter=[],
+            pagesize=10,
+            timezone=None,
+            sort='relevance'
+        )
+
+    def test_get_all_with_invalid_sort(self):
+        rv = self.app.get('/events?q=test&sort=alphabetical')
+
+        self.verify_response(rv, code=400)
+
     def test_get_all_with_invalid_page(self):
         def side_effect(*args, **kwargs):
             raise InvalidPage
 
         self._event_set.page.side_effect = side_effect
-        self._event_set.num_pages = 1
+
+        num_pages = unittest.mock.PropertyMock(return_value=1)
+        type(self._event_set).num_pages = num_pages
+
+        rv = self.app.get('/events?cursor=2&q=test&sort=relevance')
+
+        self.verify_response(rv, code=400)
+
+        self.assertIn(
+            'value range is 0 < page <= 1',
+            rv.get_json()['meta']['error_message']
+        )
+
+        # keyset cursors have no range of pages to look up
+        num_pages.reset_mock()
 
         rv = self.app.get('/events?cursor=2&q=test')
 
         self.verify_response(rv, code=400)
 
+        self.assertIn(
+            'not a cursor for a search sorted by newest',
+            rv.get_json()['meta']['error_message']
+        )
+
+        self.assertEqual(num_pages.call_count, 0)
+
+    def test_cursor_round_trip(self):
+        cursor = ByTimeRangeCursor(
+            datetime.datetime(2014, 1, 1, 12, 1, 1, 5),
+            str(uuid.uuid4())
+        )
+
+        serialize = eventlog.service.core.cursor.serialize
+        parse = eventlog.service.core.cursor.parse
+
+        self.assertEqual(parse(serialize(cursor), None), cursor)
+        self.assertEqual(parse(serialize(BySearchCursor(2)), None).page, 2)
+
     def test_get_all_with_timezone(self):
         rv = self.app.get('/events?tz=America/Toronto')
 
@@ -613,7 +716,8 @@ class TestEvents(unittest.TestCase):
             after=None,
             to_filter=[],
             pagesize=10,
-            timezone=None
+            timezone=None,
+            sort='newest'
         )
 
     def test_get_all_with_search_with_unsearchable_feeds(self):
@@ -642,7 +746,8 @@ class TestEvents(unittest.TestCase):
             after=None,
             to_filter=None,
             pagesize=10,
-            timezone=None
+            timezone=None,
+            sort='newest'
         )
 
     def test_get_single(self):
@@ -706,7 +811,371 @@ class TestEvents(unittest.TestCase):
 
         self.verify_response(rv, code=500)
 
+    def test_get_all_conditional(self):
+        rv = self.app.get('/events')
+
+        self.verify_response(rv, pagination={})
+
+        self.assertIn('ETag', rv.headers)
+        self.assertEqual(
+            rv.headers['Last-Modified'],
+            'Wed, 01 Jan 2014 12:01:01 GMT'
+        )
+
+        store.get_events_by_timerange.reset_mock()
+
+        # matching ETag
+        rv = self.app.get(
+            '/events',
+            headers={'If-None-Match': rv.headers['ETag']}
+        )
+
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.data, b'')
+
+        util.check_has_allow_origin(rv)
+
+        store.get_events_by_timerange.assert_not_called()
+
+        # not modified since
+        rv = self.app.get(
+            '/events',
+            headers={'If-Modified-Since': 'Wed, 01 Jan 2014 12:01:01 GMT'}
+        )
+
+        self.assertEqual(rv.status_code, 304)
+
+        store.get_events_by_timerange.assert_not_called()
+
+    def test_get_all_conditional_modified(self):
+        rv = self.app.get('/events')
+
+        etag = rv.headers['ETag']
+
+        # bump generation of one feed
+        store.get_generations.return_value['jazz'] = (2, self._modified)
+
+        rv = self.app.get('/events', headers={'If-None-Match': etag})
+
+        self.verify_response(rv, pagination={})
+
+        self.assertNotEqual(etag, rv.headers['ETag'])
+
+        rv = self.app.get(
+            '/events',
+            headers={'If-Modified-Since': 'Tue, 31 Dec 2013 12:01:01 GMT'}
+        )
+
+        self.verify_response(rv, pagination={})
+
+    def test_get_all_conditional_with_feeds(self):
+        rv = self.app.get('/events?feeds=bar')
+
+        etag = rv.headers['ETag']
+
+        self.assertEqual(
+            rv.headers['Last-Modified'],
+            'Tue, 31 Dec 2013 12:01:01 GMT'
+        )
+
+        # changes to other feeds don't affect the requested feeds
+        store.get_generations.return_value['foo'] = (4, self._modified)
+
+        rv = self.app.get('/events?feeds=bar', headers={'If-None-Match': etag})
+
+        self.assertEqual(rv.status_code, 304)
+
+    def test_get_single_conditional(self):
+        # reset called count
+        store.get_events_by_ids.reset_mock()
+
+        rv = self.app.get('/events/1', headers={'If-None-Match': '*'})
+
+        self.assertEqual(rv.status_code, 304)
+
+        store.get_events_by_ids.assert_not_called()
+
+    def test_get_all_with_ids(self):
+        self._jazz_feed.is_public = False
+
+        ids = [str(uuid.uuid4()) for i in range(3)]
+
+        found = [
+            unittest.mock.Mock(**{
+                'feed': {'short_name': short_name},
+                'dict.return_value': {'id': i}
+            })
+            for i, short_name in zip(ids, ['foo', 'jazz', 'bar'])
+        ]
+
+        self._event_set.__iter__ = unittest.mock.Mock(return_value=iter(found))
+
+        rv = self.app.get('/events?ids=%s,%s' % (','.join(ids), ids[0]))
+
+        # events from private feeds are omitted, store order is kept
+        self.verify_response(
+            rv,
+            pagination={},
+            data=[{'id': ids[0]}, {'id': ids[2]}]
+        )
+
+        store.get_events_by_ids.assert_called_with(
+            sorted(ids),
+            pagesize=3,
+            embed_related=True,
+            timezone=None
+        )
+
+    def test_get_all_with_ids_and_feeds(self):
+        ids = [str(uuid.uuid4()) for i in range(2)]
+
+        found = [
+            unittest.mock.Mock(**{
+                'feed': {'short_name': short_name},
+                'dict.return_value': {'id': i}
+            })
+            for i, short_name in zip(ids, ['foo', 'bar'])
+        ]
+
+        self._event_set.__iter__ = unittest.mock.Mock(return_value=iter(found))
+
+        rv = self.app.get(
+            '/events?ids=%s&feeds=bar&embed_related=count&tz=UTC' % (
+                ','.join(ids)
+            )
+        )
+
+        self.verify_response(rv, pagination={}, data=[{'id': ids[1]}])
+
+        store.get_events_by_ids.assert_called_with(
+            sorted(ids),
+            pagesize=2,
+            embed_related=True,
+            timezone='UTC'
+        )
+
+        found[1].dict.assert_called_with(
+            base_uri='base_uri',
+            related_count_only=True
+        )
+
+    def test_get_all_with_too_many_ids(self):
+        ids = [str(uuid.uuid4()) for i in range(101)]
+
+        rv = self.app.get('/events?ids=%s' % (','.join(ids)))
+
+        self.verify_response(rv, code=400)
+
+    def test_get_all_with_ids_and_other_filters(self):
+        ids = [str(uuid.uuid4()) for i in range(2)]
+
+        rv = self.app.get('/events?ids=%s&q=foo&on=2014-01-01' % (
+            ','.join(ids)
+        ))
+
+        self.verify_response(rv, code=400)
+
+        self.assertIn(
+            'q, on',
+            rv.get_json()['meta']['error_message']
+        )
+
+    def test_export(self):
+
+        def iterable(server_side=False):
+            for i in range(3):
+                event_attrs = {'dict.return_value': {'id': str(i)}}
+
+                yield unittest.mock.Mock(**event_attrs)
+
+        self._event_set.iter.side_effect = iterable
+
+        rv = self.app.get('/events/export', headers=self.prepare_auth_header())
+
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.headers['Content-Type'], 'application/x-ndjson')
+
+        util.check_has_allow_origin(rv)
+
+        lines = rv.data.decode('utf-8').splitlines()
+
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': '0'}, {'id': '1'}, {'id': '2'}]
+        )
+
+        store.get_events_by_timerange.assert_called_with(
+            after=None,
+            before=None,
+            feeds=self._all_feeds_names,
+            timezone=None
+        )
+
+        self._event_set.iter.assert_called_with(server_side=True)
+
+    def test_export_with_filters(self):
+
+        after_datestr = '2014-01-01 12:01:01.00'
+        before_datestr = '2014-02-01 12:01:01.00'
+
+        self._event_set.iter.return_value = iter([])
+
+        rv = self.app.get(
+            '/events/export?feeds=foo&tz=America/Toronto'
+            '&after=%s&before=%s' % (after_datestr, before_datestr),
+            headers=self.prepare_auth_header()
+        )
+
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.data, b'')
+
+        store.get_events_by_timerange.assert_called_with(
+            after=datetime.datetime.strptime(after_datestr, DATETIME_FMT),
+            before=datetime.datetime.strptime(before_datestr, DATETIME_FMT),
+            feeds=['foo'],
+            timezone='America/Toronto'
+        )
+
+    def test_export_unauthorized(self):
+        # reset called count
+        store.get_events_by_timerange.reset_mock()
+
+        rv = self.app.get('/events/export')
+
+        self.verify_response(rv, code=401)
+
+        store.get_events_by_timerange.assert_not_called()
+
+    def test_export_with_invalid_feeds(self):
+        rv = self.app.get(
+            '/events/export?feeds=blu',
+            headers=self.prepare_auth_header()
+        )
+
+        self.verify_response(rv, code=400)
+
+    def test_export_with_inconsistent_after_and_before(self):
+        rv = self.app.get(
+            '/events/export?after=2014-02-01 12:01:01.00'
+            '&before=2014-01-01 12:01:01.00',
+            headers=self.prepare_auth_header()
+        )
+
+        self.verify_response(rv, code=400)
+
     def test_delete_not_allowed(self):
         rv = self.app.delete('/events')
 
         self.verify_response(rv, code=405)
+
+    def prepare_subscription(self, *batches):
+        batches = list(batches)
+
+        subscription = unittest.mock.Mock(overflowed=False)
+
+        def get(timeout):
+            if batches:
+                return batches.pop(0)
+
+            # end the stream after one keepalive
+            subscription.overflowed = True
+
+            raise queue.Empty
+
+        subscription.get.side_effect = get
+
+        patcher = unittest.mock.patch(
+            'eventlog.service.endpoints.events.broadcaster'
+        )
+
+        broadcaster = patcher.start()
+        broadcaster.subscribe.return_value = subscription
+
+        self.addCleanup(patcher.stop)
+
+        return broadcaster, subscription
+
+    def prepare_event(self, event_id, short_name):
+        event_attrs = {
+            'id': event_id,
+            'feed': {'short_name': short_name},
+            'dict.return_value': {'id': event_id}
+        }
+
+        return unittest.mock.Mock(**event_attrs)
+
+    def parse_stream(self, data):
+        messages = []
+
+        for block in data.decode('utf-8').split('\n\n'):
+            if block:
+                messages.append(block.split('\n'))
+
+        return messages
+
+    def test_stream(self):
+        app.config['STREAM_KEEPALIVE'] = 0.01
+
+        self.addCleanup(app.config.pop, 'STREAM_KEEPALIVE')
+
+        self._jazz_feed.is_public = False
+
+        broadcaster, subscription = self.prepare_subscription(
+            [self.prepare_event('1', 'foo'), self.prepare_event('2', 'jazz')],
+            [self.prepare_event('3', 'bar')]
+        )
+
+        rv = self.app.get('/events/stream')
+
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, 'text/event-stream')
+        self.assertEqual(rv.headers['Cache-Control'], 'no-cache')
+
+        util.check_has_allow_origin(rv)
+
+        # private feed events are not sent
+        self.assertEqual(
+            self.parse_stream(rv.data),
+            [
+                [': connected'],
+                ['id: 1', 'event: event', 'data: {"id": "1"}'],
+                ['id: 3', 'event: event', 'data: {"id": "3"}'],
+                [': keepalive']
+            ]
+        )
+
+        subscription.get.assert_called_with(timeout=0.01)
+
+        rv.close()
+
+        broadcaster.unsubscribe.assert_called_once_with(subscription)
+
+    def test_stream_with_feeds(self):
+        self._jazz_feed.is_public = False
+
+        broadcaster, subscription = self.prepare_subscription(
+            [self.prepare_event('1', 'foo'), self.prepare_event('2', 'jazz')],
+        )
+
+        rv = self.app.get(
+            '/events/stream?feeds=jazz',
+            headers=self.prepare_auth_header()
+        )
+
+        self.assertEqual(rv.status_code, 200)
+
+        self.assertEqual(
+            self.parse_stream(rv.data)[1],
+            ['id: 2', 'event: event', 'data: {"id": "2"}']
+        )
+
+    def test_stream_with_invalid_feeds(self):
+        self._jazz_feed.is_public = False
+
+        broadcaster, subscription = self.prepare_subscription()
+
+        rv = self.app.get('/events/stream?feeds=jazz,bazz')
+
+        self.verify_response(rv, code=400)
+
+        self.assertFalse(broadcaster.subscribe.called)
@@ -20,7 +20,10 @@ class TestFeeds(unittest.TestCase):
         cls._feed = unittest.mock.Mock(**feed_attrs)
 
         # setup mock Store
-        attrs = {'get_feeds.return_value': {'foo': cls._feed}}
+        attrs = {
+            'get_feeds.return_value': {'foo': cls._feed},
+            'get_generations.return_value': {'foo': (1, None)}
+        }
 
         store.configure_mock(**attrs)
 
@@ -128,6 +131,37 @@ class TestFeeds(unittest.TestCase):
 
         self._feed.dict.assert_called_with(admin=None, base_uri='base_uri')
 
+    def test_get_all_conditional(self):
+        rv = self.app.get('/feeds')
+
+        self.assertEqual(rv.status_code, 200)
+        self.assertIn('ETag', rv.headers)
+        self.assertNotIn('Last-Modified', rv.headers)
+
+        store.reset_mock()
+
+        rv = self.app.get(
+            '/feeds',
+            headers={'If-None-Match': rv.headers['ETag']}
+        )
+
+        self.assertEqual(rv.status_code, 304)
+
+        store.get_feeds.assert_not_called()
+
+    def test_get_all_conditional_authorized(self):
+        rv = self.app.get('/feeds')
+
+        etag = rv.headers['ETag']
+
+        # authorized responses differ, so they are never matched
+        headers = self.prepare_auth_header()
+        headers['If-None-Match'] = etag
+
+        rv = self.app.get('/feeds', headers=headers)
+
+        self.assertEqual(rv.status_code, 200)
+
     def test_get_single_not_found(self):
         rv = self.app.get('/feeds/bar')
 